@@ -0,0 +1,303 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+DEFAULT_SIZES = [20, 100, 500]
+
+# Metrics compared against a baseline; lower is better for all of them
+_COMPARED_METRICS = ('seconds', 'per_item_ms', 'p50_ms', 'p95_ms', 'p99_ms')
+
+def _timed(fn, *args, **kwargs):
+    """Runs fn with its console output suppressed and returns (seconds, result)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    return elapsed, result
+
+def _latency_stats(latencies, wall_time):
+    latencies = np.asarray(latencies)
+    return {
+        'requests': int(len(latencies)),
+        'seconds': wall_time,
+        'throughput_rps': len(latencies) / wall_time if wall_time else None,
+        'mean_ms': float(latencies.mean() * 1000),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+    }
+
+def bench_api(client, image_paths, requests, concurrency):
+    """Fires /api/analyze requests from concurrency threads and records latency."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def one(i):
+        path = image_paths[i % len(image_paths)]
+        start = time.perf_counter()
+        response = client.post('/api/analyze', json={'image_path': path})
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(one, range(requests)))
+        wall_time = time.perf_counter() - start
+
+    stats = _latency_stats(latencies, wall_time)
+    stats['concurrency'] = concurrency
+    stats['errors'] = len(errors)
+    return stats
+
+class _NoResultCache:
+    """Stands in for server.results so every request runs the full analysis."""
+
+    def get(self, digest, version):
+        return None
+
+    def put(self, digest, version, result):
+        pass
+
+def bench_size(num_samples, workers, requests, concurrency, with_matplotlib):
+    """Runs every pipeline stage on a fresh dataset of num_samples frames."""
+    from data_generator import generate_traffic_data
+    from feature_extractor import extract_counts
+    from model_registry import get_registry
+    from model_trainer import train_traffic_model
+    from renderer import render_traffic_png
+    from traffic_predictor import predict_traffic, predict_traffic_batch, read_image
+
+    get_registry().clear()
+    results = {}
+
+    seconds, _ = _timed(generate_traffic_data, num_samples=num_samples, seed=0, workers=workers)
+    results['generate'] = {'seconds': seconds, 'per_item_ms': seconds / num_samples * 1000}
+
+    seconds, _ = _timed(extract_counts, workers=workers, use_cache=False)
+    results['extract_full'] = {'seconds': seconds, 'per_item_ms': seconds / num_samples * 1000}
+
+    seconds, _ = _timed(extract_counts, workers=workers)
+    results['extract_incremental'] = {'seconds': seconds}
+
+    seconds, _ = _timed(train_traffic_model)
+    results['train'] = {'seconds': seconds}
+
+    image_paths = [os.path.join('data', f"traffic_{i:04d}.png") for i in range(num_samples)]
+    single = image_paths[:min(50, num_samples)]
+
+    # First call pays for loading the model
+    seconds, _ = _timed(predict_traffic, single[0])
+    results['predict_first_call'] = {'seconds': seconds}
+
+    latencies = []
+    for path in single:
+        seconds, _ = _timed(predict_traffic, path)
+        latencies.append(seconds)
+    results['predict_single'] = _latency_stats(latencies, sum(latencies))
+
+    seconds, _ = _timed(predict_traffic_batch, image_paths)
+    results['predict_batch'] = {'seconds': seconds, 'per_item_ms': seconds / num_samples * 1000}
+
+    images = [read_image(path) for path in single]
+    latencies = []
+    for img in images:
+        seconds, _ = _timed(render_traffic_png, img, [1, 2, 3, 4], 'med')
+        latencies.append(seconds)
+    results['render_cv2'] = _latency_stats(latencies, sum(latencies))
+
+    if with_matplotlib:
+        import matplotlib.pyplot as plt
+        from visualizer import visualize_traffic
+        latencies = []
+        for path in single[:10]:
+            seconds, _ = _timed(visualize_traffic, path, [1, 2, 3, 4], 'med')
+            plt.close('all')
+            latencies.append(seconds)
+        results['render_matplotlib'] = _latency_stats(latencies, sum(latencies))
+
+    import server
+    from result_cache import ResultCache
+    client = server.app.test_client()
+
+    # Repeated frames are answered from the result cache, so the share of hits
+    # would depend on the dataset size. Time full analyses and hits separately.
+    server.results = _NoResultCache()
+    results['api_analyze'] = bench_api(client, image_paths, requests, concurrency)
+
+    server.results = ResultCache(path=os.path.join('output', 'bench_results.sqlite'))
+    server.results.clear()
+    bench_api(client, image_paths, len(image_paths), concurrency)
+    results['api_analyze_cached'] = bench_api(client, image_paths, requests, concurrency)
+    return results
+
+def _summarize_runs(runs):
+    """
+    Combines repeated bench_size() results into one.
+
+    Every metric becomes the median over the runs (errors are summed), and
+    each stage gets a 'spread' dict with the median absolute deviation of
+    its compared metrics relative to their median: how noisy they are, in a
+    way a single outlying run doesn't inflate.
+    """
+    summary = {}
+    for stage in runs[0]:
+        samples = [run[stage] for run in runs if stage in run]
+        merged, spread = {}, {}
+        for metric, value in samples[0].items():
+            values = [sample[metric] for sample in samples if sample.get(metric) is not None]
+            if metric == 'errors':
+                merged[metric] = int(sum(values))
+            elif values and isinstance(value, (int, float)):
+                merged[metric] = float(np.median(values))
+                if metric in _COMPARED_METRICS and merged[metric]:
+                    deviation = np.median(np.abs(np.asarray(values) - merged[metric]))
+                    spread[metric] = float(deviation / merged[metric])
+            else:
+                merged[metric] = value
+        merged['spread'] = spread
+        summary[stage] = merged
+    return summary
+
+def run_benchmarks(sizes=DEFAULT_SIZES, workers=1, requests=200, concurrency=8, with_matplotlib=False,
+                   repeats=3, warmup=True):
+    """
+    Benchmarks every pipeline stage for each dataset size.
+
+    Each run uses its own temporary working directory so the repository's
+    data/ and output/ directories are left untouched. An unrecorded warm-up
+    run on the smallest size pays one-off costs (imports, first model loads),
+    then every size is run repeats times and the median of each metric is
+    reported along with its spread.
+
+    Returns:
+        Dict with run metadata and per-size results
+    """
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'workers': workers,
+            'requests': requests,
+            'concurrency': concurrency,
+            'repeats': repeats,
+        },
+        'results': {},
+    }
+
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    if repo_dir not in sys.path:
+        sys.path.insert(0, repo_dir)
+    original_dir = os.getcwd()
+
+    def run_once(size):
+        work_dir = tempfile.mkdtemp(prefix=f'traffic_bench_{size}_')
+        try:
+            os.chdir(work_dir)
+            return bench_size(size, workers, requests, concurrency, with_matplotlib)
+        finally:
+            os.chdir(original_dir)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if warmup:
+        print(f"Warming up on {min(sizes)} frames...")
+        run_once(min(sizes))
+
+    for size in sizes:
+        runs = []
+        for i in range(max(1, repeats)):
+            print(f"Benchmarking {size} frames (run {i + 1}/{max(1, repeats)})...")
+            runs.append(run_once(size))
+        report['results'][str(size)] = _summarize_runs(runs)
+    return report
+
+def compare_to_baseline(report, baseline, threshold=0.10):
+    """
+    Compares a report with a saved baseline report.
+
+    Args:
+        report: Report from run_benchmarks()
+        baseline: Earlier report to compare against
+        threshold: Relative slowdown treated as a regression (0.10 = 10%). It is
+            widened by the spread measured for the metric in both reports, so a
+            change has to exceed the run-to-run noise to count.
+
+    Returns:
+        List of (size, stage, metric, baseline_value, current_value, ratio) for every
+        compared metric, and the subset that regressed
+    """
+    rows, regressions = [], []
+    for size, stages in report['results'].items():
+        for stage, metrics in stages.items():
+            base_metrics = baseline.get('results', {}).get(size, {}).get(stage)
+            if not base_metrics:
+                continue
+            for metric in _COMPARED_METRICS:
+                old, new = base_metrics.get(metric), metrics.get(metric)
+                if not old or new is None:
+                    continue
+                row = (size, stage, metric, old, new, new / old)
+                rows.append(row)
+                noise = metrics.get('spread', {}).get(metric, 0) + base_metrics.get('spread', {}).get(metric, 0)
+                if new / old > 1 + threshold + noise:
+                    regressions.append(row)
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the traffic analysis pipeline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Dataset sizes to benchmark')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for generation and extraction')
+    parser.add_argument('--requests', type=int, default=200, help='Number of /api/analyze requests per size')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent API clients')
+    parser.add_argument('--matplotlib', action='store_true', help='Also time the matplotlib visualizer')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='Where to write the JSON report')
+    parser.add_argument('--baseline', type=str, default=None, help='Baseline JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative slowdown counted as a regression, on top of the measured spread')
+    parser.add_argument('--repeats', type=int, default=3, help='Runs per size; medians are reported')
+    parser.add_argument('--no-warmup', action='store_true', help='Skip the unrecorded warm-up run')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.workers, args.requests, args.concurrency, args.matplotlib,
+                            repeats=args.repeats, warmup=not args.no_warmup)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    for size, stages in report['results'].items():
+        print(f"\n{size} frames:")
+        for stage, metrics in stages.items():
+            summary = ', '.join(f"{k}={v:.4g}" for k, v in metrics.items() if isinstance(v, float))
+            print(f"  {stage:22s} {summary}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressions = compare_to_baseline(report, baseline, args.threshold)
+        print(f"\nCompared {len(rows)} metrics against {args.baseline}")
+        for size, stage, metric, old, new, ratio in regressions:
+            print(f"  REGRESSION {size}/{stage}/{metric}: {old:.4g} -> {new:.4g} ({ratio:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print("  No regressions")
+
+if __name__ == '__main__':
+    main()
@@ -1,65 +1,170 @@
 import cv2
 import numpy as np
 import os
-import random
+from concurrent.futures import ProcessPoolExecutor
+from dataset import create_packed_dataset, open_packed_for_write, write_packed_filenames
+from lane_geometry import NUM_LANES, LANE_WIDTH
 
-def generate_traffic_data(num_samples=100, num_lanes=4, lane_width=200, height=600):
+def _encode_params(image_format, png_compression, jpeg_quality):
     """
-    Generates synthetic traffic data and saves images and metadata.
+    Returns the file extension and cv2.imwrite parameters for an output format.
+    The packed format has no per-frame encoding and returns (None, None).
     """
-    # Create data directory if it doesn't exist
-    data_dir = 'data'
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
-        print(f"Created directory: {data_dir}")
-
-    # Set up image dimensions
+    if image_format == 'packed':
+        return None, None
+    if image_format == 'png':
+        # Any explicit level replaces OpenCV's fast default PNG encoding
+        if png_compression is None:
+            return '.png', []
+        return '.png', [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+    if image_format in ('jpg', 'jpeg'):
+        return '.jpg', [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+    raise ValueError(f"Unsupported image format: {image_format}")
+
+def _road_background(num_lanes, lane_width, height):
+    """Creates the empty road with lane markings shared by every frame."""
     width = num_lanes * lane_width
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    img[:, :] = (50, 50, 50)  # Dark gray background for road
+
+    # Draw lane markings
+    for lane in range(1, num_lanes):
+        x = lane * lane_width
+        cv2.line(img, (x, 0), (x, height), (255, 255, 255), 2)
+    return img
 
-    metadata = []
+def render_frame(rng, background, num_lanes, lane_width):
+    """
+    Draws one synthetic traffic frame.
 
-    for i in range(num_samples):
-        # Create a blank image (road)
-        img = np.zeros((height, width, 3), dtype=np.uint8)
-        img[:, :] = (50, 50, 50)  # Dark gray background for road
+    All vehicle sizes, positions and colours are drawn from rng in a few
+    vectorized calls before being painted onto a copy of the background.
 
-        # Draw lane markings
-        for lane in range(1, num_lanes):
-            x = lane * lane_width
-            cv2.line(img, (x, 0), (x, height), (255, 255, 255), 2)
+    Args:
+        rng: numpy Generator for this frame
+        background: Road image from _road_background()
+        num_lanes: Number of lanes
+        lane_width: Width of each lane in pixels
 
-        # Generate random number of vehicles per lane
-        true_counts = []
-        for lane in range(num_lanes):
-            # Random number of vehicles in this lane (0-10)
-            num_vehicles = random.randint(0, 10)
-            true_counts.append(num_vehicles)
+    Returns:
+        (image, true_counts) where true_counts is an int array per lane
+    """
+    height = background.shape[0]
+    img = background.copy()
 
-            # Create vehicles in this lane
-            for _ in range(num_vehicles):
-                # Vehicle size
-                w, h = random.randint(40, 60), random.randint(80, 120)
+    # Random number of vehicles per lane (0-10)
+    true_counts = rng.integers(0, 11, size=num_lanes)
+    lanes = np.repeat(np.arange(num_lanes), true_counts)
+    n = len(lanes)
 
-                # Vehicle position
-                x = lane * lane_width + random.randint(20, lane_width - w - 20)
-                y = random.randint(0, height - h)
+    # Vehicle sizes, positions and random bright colours
+    w = rng.integers(40, 61, size=n)
+    h = rng.integers(80, 121, size=n)
+    x = lanes * lane_width + rng.integers(20, lane_width - w - 20 + 1)
+    y = rng.integers(0, height - h + 1)
+    colors = rng.integers(100, 256, size=(n, 3), dtype=np.uint8)
 
-                # Vehicle color (random bright color)
-                color = (random.randint(100, 255), random.randint(100, 255), random.randint(100, 255))
+    # Filled rectangles, inclusive of the far corner like cv2.rectangle
+    for x0, y0, x1, y1, color in zip(x, y, x + w, y + h, colors):
+        img[y0:y1 + 1, x0:x1 + 1] = color
 
-                # Draw vehicle
-                cv2.rectangle(img, (x, y), (x + w, y + h), color, -1)
+    return img, true_counts
 
-        # Save the image
-        filename = f"traffic_{i:04d}.png"
-        file_path = os.path.join(data_dir, filename)
-        cv2.imwrite(file_path, img)
+def _generate_chunk(data_dir, start, stop, seed, num_lanes, lane_width, height, ext, params):
+    """
+    Generates and writes frames start..stop-1 (runs inside a worker process).
 
-        # Add to metadata
-        metadata.append((filename, true_counts))
+    Frame i always uses the RNG stream seeded with (seed, i), so output does
+    not depend on how frames are split across workers. With ext None frames
+    are written straight into the packed dataset in data_dir.
+    """
+    background = _road_background(num_lanes, lane_width, height)
+    counts = np.zeros((stop - start, num_lanes), dtype=np.int64)
+
+    packed_frames = packed_counts = None
+    if ext is None:
+        packed_frames, packed_counts = open_packed_for_write(data_dir)
+
+    for i in range(start, stop):
+        rng = np.random.default_rng([seed, i])
+        img, true_counts = render_frame(rng, background, num_lanes, lane_width)
+        if packed_frames is not None:
+            packed_frames[i] = img
+        else:
+            cv2.imwrite(os.path.join(data_dir, f"traffic_{i:04d}{ext}"), img, params)
+        counts[i - start] = true_counts
+
+    if packed_frames is not None:
+        packed_counts[start:stop] = counts
+        packed_frames.flush()
+        packed_counts.flush()
+    return counts
+
+def generate_traffic_data(num_samples=100, num_lanes=NUM_LANES, lane_width=LANE_WIDTH, height=600,
+                          seed=None, workers=1, chunk_size=64, image_format='png',
+                          png_compression=None, jpeg_quality=95, data_dir='data'):
+    """
+    Generates synthetic traffic data and saves images and metadata.
 
-    metadata_array = np.array(metadata, dtype=object)  # 📌 key change
+    Args:
+        num_samples: Number of frames to generate
+        num_lanes: Number of lanes per frame
+        lane_width: Width of each lane in pixels
+        height: Frame height in pixels
+        seed: Base seed; the same seed always yields the same frames. None picks a random one.
+        workers: Number of worker processes. None or a value below 1 uses every core.
+        chunk_size: Number of frames handed to a worker at a time
+        image_format: 'png', 'jpg', or 'packed' to write a memory-mappable dataset
+            (see dataset.py) into data_dir/packed instead of loose images
+        png_compression: PNG compression level 0-9, or None for OpenCV's default encoding,
+            which is the fastest. Setting a level trades generation speed for smaller files.
+        jpeg_quality: JPEG quality 0-100
+        data_dir: Output directory
+    """
+    # Create data directory if it doesn't exist
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+        print(f"Created directory: {data_dir}")
 
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    ext, params = _encode_params(image_format, png_compression, jpeg_quality)
+    chunk_args = (seed, num_lanes, lane_width, height, ext, params)
+    output_dir = data_dir
+
+    if ext is None:
+        output_dir = os.path.join(data_dir, 'packed')
+        create_packed_dataset(output_dir, num_samples, (height, num_lanes * lane_width, 3), num_lanes)
+
+    # Preallocated ground truth, filled chunk by chunk
+    counts = np.zeros((num_samples, num_lanes), dtype=np.int64)
+
+    if workers is None or workers < 1:
+        workers = os.cpu_count() or 1
+
+    if workers == 1:
+        counts[:] = _generate_chunk(output_dir, 0, num_samples, *chunk_args)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for start in range(0, num_samples, chunk_size):
+                stop = min(start + chunk_size, num_samples)
+                futures[start] = executor.submit(_generate_chunk, output_dir, start, stop, *chunk_args)
+            for start, future in futures.items():
+                chunk_counts = future.result()
+                counts[start:start + len(chunk_counts)] = chunk_counts
+
+    if ext is None:
+        write_packed_filenames(output_dir, [f"traffic_{i:04d}" for i in range(num_samples)])
+        print(f"Generated {num_samples} traffic frames into packed dataset '{output_dir}'")
+        return
+
+    # Metadata rows of (filename, true_counts)
+    metadata_array = np.empty((num_samples, 2), dtype=object)
+    for i, true_counts in enumerate(counts.tolist()):
+        metadata_array[i, 0] = f"traffic_{i:04d}{ext}"
+        metadata_array[i, 1] = true_counts
 
     # Save metadata - FIX: added allow_pickle=True
     np.save(os.path.join(data_dir, 'metadata.npy'), metadata_array, allow_pickle=True)
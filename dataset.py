@@ -0,0 +1,165 @@
+import cv2
+import numpy as np
+import os
+from numpy.lib.format import open_memmap
+
+# Files making up a packed dataset directory
+FRAMES_FILE = 'frames.npy'
+COUNTS_FILE = 'counts.npy'
+FILENAMES_FILE = 'filenames.npy'
+
+# Where data_generator and feature_extractor look for a packed dataset by default
+DEFAULT_PACKED_DIR = os.path.join('data', 'packed')
+
+def create_packed_dataset(directory, num_frames, frame_shape, num_lanes):
+    """
+    Allocates an empty packed dataset on disk.
+
+    Frames live in a single (N, H, W, 3) uint8 .npy file and ground-truth
+    counts in an (N, num_lanes) int32 .npy file, both memory-mappable.
+
+    Args:
+        directory: Output directory
+        num_frames: Number of frames
+        frame_shape: (height, width, channels) of every frame
+        num_lanes: Number of lanes per frame
+    """
+    os.makedirs(directory, exist_ok=True)
+    frames = open_memmap(os.path.join(directory, FRAMES_FILE), mode='w+',
+                         dtype=np.uint8, shape=(num_frames,) + tuple(frame_shape))
+    counts = open_memmap(os.path.join(directory, COUNTS_FILE), mode='w+',
+                         dtype=np.int32, shape=(num_frames, num_lanes))
+    del frames, counts  # flushed on close
+
+def open_packed_for_write(directory):
+    """
+    Memory-maps an allocated packed dataset for writing.
+
+    Several processes may write concurrently as long as their row ranges
+    don't overlap. Call flush() on both arrays when done.
+
+    Returns:
+        (frames, counts) writable memmaps
+    """
+    frames = np.load(os.path.join(directory, FRAMES_FILE), mmap_mode='r+')
+    counts = np.load(os.path.join(directory, COUNTS_FILE), mmap_mode='r+')
+    return frames, counts
+
+def write_packed_filenames(directory, filenames):
+    """Stores the original frame names alongside a packed dataset."""
+    np.save(os.path.join(directory, FILENAMES_FILE), np.asarray(filenames, dtype=str))
+
+class PackedDataset:
+    """
+    Read-only view of a packed dataset.
+
+    Frames are memory-mapped, so indexing and slicing return zero-copy views
+    and only the pages actually touched are read from disk.
+    """
+
+    def __init__(self, directory=DEFAULT_PACKED_DIR):
+        frames_path = os.path.join(directory, FRAMES_FILE)
+        if not os.path.exists(frames_path):
+            raise FileNotFoundError(f"Packed dataset not found: {frames_path}")
+
+        self.directory = directory
+        self.frames = np.load(frames_path, mmap_mode='r')
+        self.counts = np.load(os.path.join(directory, COUNTS_FILE), mmap_mode='r')
+
+        filenames_path = os.path.join(directory, FILENAMES_FILE)
+        if os.path.exists(filenames_path):
+            self.filenames = np.load(filenames_path)
+        else:
+            self.filenames = np.array([f"frame_{i:06d}" for i in range(len(self.frames))])
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        """Returns (frame, true_counts) for an index or slice."""
+        return self.frames[index], self.counts[index]
+
+    def iter_batches(self, batch_size=256, start=0, stop=None):
+        """
+        Yields (offset, frames, counts) views over consecutive batches.
+
+        Args:
+            batch_size: Frames per batch
+            start: First frame index
+            stop: One past the last frame index (defaults to the end)
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        for offset in range(start, stop, batch_size):
+            end = min(offset + batch_size, stop)
+            yield offset, self.frames[offset:end], self.counts[offset:end]
+
+def pack_directory(data_dir='data', output_dir=DEFAULT_PACKED_DIR):
+    """
+    Converts loose images plus metadata.npy into a packed dataset.
+
+    Every image must have the same shape. Images that can't be read are skipped.
+
+    Args:
+        data_dir: Directory with the images and metadata.npy
+        output_dir: Directory for the packed dataset
+    """
+    metadata_path = os.path.join(data_dir, 'metadata.npy')
+    if not os.path.exists(metadata_path):
+        raise FileNotFoundError(f"Metadata file not found: {metadata_path}")
+
+    metadata = np.load(metadata_path, allow_pickle=True)
+    entries = []
+    for fname, true_counts in metadata:
+        img_path = os.path.join(data_dir, fname)
+        if os.path.exists(img_path):
+            entries.append((fname, true_counts))
+        else:
+            print(f"Warning: Image not found: {img_path}")
+
+    if not entries:
+        raise ValueError("No images to pack")
+
+    first = cv2.imread(os.path.join(data_dir, entries[0][0]))
+    if first is None:
+        raise Exception(f"Failed to read image: {entries[0][0]}")
+    create_packed_dataset(output_dir, len(entries), first.shape, len(entries[0][1]))
+
+    frames, counts = open_packed_for_write(output_dir)
+    filenames = []
+    row = 0
+    for fname, true_counts in entries:
+        img = cv2.imread(os.path.join(data_dir, fname))
+        if img is None or img.shape != first.shape:
+            print(f"Warning: Skipping unreadable or mismatched image: {fname}")
+            continue
+        frames[row] = img
+        counts[row] = true_counts
+        filenames.append(fname)
+        row += 1
+    frames.flush()
+    counts.flush()
+    del frames, counts
+
+    if row < len(entries):
+        # Trim the unused tail
+        _truncate(output_dir, row)
+    write_packed_filenames(output_dir, filenames)
+    print(f"Packed {row} frames into '{output_dir}'")
+
+def _truncate(directory, num_frames):
+    """Rewrites a packed dataset keeping only its first num_frames rows."""
+    for name in (FRAMES_FILE, COUNTS_FILE):
+        path = os.path.join(directory, name)
+        data = np.load(path, mmap_mode='r')[:num_frames]
+        tmp_path = path + '.tmp.npy'
+        out = open_memmap(tmp_path, mode='w+', dtype=data.dtype, shape=data.shape)
+        out[:] = data
+        out.flush()
+        del out, data
+        os.replace(tmp_path, path)
+
+if __name__ == '__main__':
+    try:
+        pack_directory()
+    except Exception as e:
+        print(f"Error: {e}")
@@ -0,0 +1,175 @@
+import cv2
+import numpy as np
+import metrics
+from lane_geometry import NUM_LANES, LANE_WIDTH, vertical_strips
+
+# Blobs smaller than this many pixels are treated as noise
+MIN_AREA = 100
+
+
+def count_vehicles(img, num_lanes=NUM_LANES, lane_width=LANE_WIDTH, min_area=MIN_AREA, geometry=None):
+    """
+    Counts vehicles per lane in a traffic frame.
+
+    The frame is thresholded to binary and its connected components are
+    labelled in one pass. Components below min_area are discarded and the
+    remaining centroids are looked up in the lane geometry's label image and
+    bucketed with a single bincount.
+
+    Args:
+        img: BGR (or already grayscale) image as a NumPy array
+        num_lanes: Number of vertical lanes in the frame (without a geometry)
+        lane_width: Width of each lane in pixels (without a geometry)
+        min_area: Minimum blob area in pixels to count as a vehicle
+        geometry: LaneGeometry of the camera (defaults to vertical strips)
+
+    Returns:
+        List of vehicle counts per lane
+    """
+    if geometry is None:
+        geometry = vertical_strips(num_lanes, lane_width)
+    gray = _to_gray(img)
+    return geometry.count(_blob_centroids(gray, min_area), gray.shape).tolist()
+
+def _to_gray(img):
+    if img.ndim == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return img
+
+def _components(gray):
+    """Labels bright blobs and returns their (centroids, stats), background excluded."""
+    with metrics.stage('threshold'):
+        _, thresh = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
+    with metrics.stage('components'):
+        _, _, stats, centroids = cv2.connectedComponentsWithStats(thresh, connectivity=8)
+
+    # Row 0 is the background component
+    return centroids[1:], stats[1:]
+
+def _blob_centroids(gray, min_area):
+    """Returns the (x, y) centroids of bright blobs of at least min_area pixels."""
+    centroids, stats = _components(gray)
+    return centroids[stats[:, cv2.CC_STAT_AREA] >= min_area]
+
+class FrameDiffDetector:
+    """
+    Stateful per-camera detector that only re-counts lanes that changed.
+
+    Each lane keeps the grayscale pixels it had when it was last counted.
+    For a new frame, the number of pixels per lane that differ from that
+    reference by more than pixel_threshold is computed in one vectorized
+    pass (a bincount of the lane-label image over the changed pixels). Lanes
+    above change_threshold are re-counted from a window around the lane's
+    bounding box (so blobs near lane boundaries keep their true centroid);
+    the others reuse their previous counts. If the window cuts a blob that
+    reaches into the lane, the frame is labelled in full instead (at most
+    once per frame), so a re-counted lane always gets the count
+    count_vehicles would give it.
+
+    Use one instance per camera; frames must arrive in order.
+    """
+
+    def __init__(self, num_lanes=NUM_LANES, lane_width=LANE_WIDTH, min_area=MIN_AREA,
+                 pixel_threshold=25, change_threshold=0.002, margin=None, geometry=None):
+        """
+        Args:
+            num_lanes: Number of vertical lanes in the frame (without a geometry)
+            lane_width: Width of each lane in pixels (without a geometry)
+            min_area: Minimum blob area in pixels to count as a vehicle
+            pixel_threshold: Grayscale difference above which a pixel counts as changed
+            change_threshold: Fraction of changed pixels that triggers re-detection of a lane
+            margin: Extra pixels around a lane included when re-counting it
+                (defaults to half the width of each lane's bounding box)
+            geometry: LaneGeometry of the camera (defaults to vertical strips)
+        """
+        self.geometry = vertical_strips(num_lanes, lane_width) if geometry is None else geometry
+        self.num_lanes = self.geometry.num_lanes
+        self.min_area = min_area
+        self.pixel_threshold = pixel_threshold
+        self.change_threshold = change_threshold
+        self.margin = margin
+        self.frames = 0
+        self.lanes_detected = 0
+        self.full_recounts = 0
+        self.reset()
+
+    def reset(self):
+        """Forgets the reference frame so the next frame is counted in full."""
+        self._reference = None
+        self._counts = None
+
+    def _compile(self, shape):
+        """Caches the label image, lane areas and re-count windows for a frame shape."""
+        height, width = shape
+        self._labels = self.geometry.label_map(shape)
+        self._areas = np.bincount(self._labels.ravel() + 1, minlength=self.num_lanes + 1)[1:]
+        bounds = self.geometry.lane_bounds(shape)
+        self._bounds = bounds
+        margin = (bounds[:, 2] - bounds[:, 0]) // 2 if self.margin is None else self.margin
+        self._windows = np.column_stack([
+            (bounds[:, 0] - margin).clip(0, width), (bounds[:, 1] - margin).clip(0, height),
+            (bounds[:, 2] + margin).clip(0, width), (bounds[:, 3] + margin).clip(0, height)])
+
+    def _window_centroids(self, gray, lane):
+        """
+        Returns the centroids (in frame coordinates) of the blobs in a lane's
+        re-count window, or None if the window's edge cuts a blob that reaches
+        into the lane's bounding box: that blob's centroid would be wrong, or
+        it could be dropped as too small. Cut blobs that stay outside the box
+        belong to neighbouring lanes and are ignored.
+        """
+        height, width = gray.shape
+        x0, y0, x1, y1 = self._windows[lane]
+        centroids, stats = _components(np.ascontiguousarray(gray[y0:y1, x0:x1]))
+        left = stats[:, cv2.CC_STAT_LEFT] + x0
+        top = stats[:, cv2.CC_STAT_TOP] + y0
+        right = left + stats[:, cv2.CC_STAT_WIDTH]
+        bottom = top + stats[:, cv2.CC_STAT_HEIGHT]
+        cut = (((left == x0) & (x0 > 0)) | ((top == y0) & (y0 > 0)) |
+               ((right == x1) & (x1 < width)) | ((bottom == y1) & (y1 < height)))
+        bx0, by0, bx1, by1 = self._bounds[lane]
+        in_box = (left < bx1) & (right > bx0) & (top < by1) & (bottom > by0)
+        if np.any(cut & in_box):
+            return None
+        return centroids[stats[:, cv2.CC_STAT_AREA] >= self.min_area] + (x0, y0)
+
+    def update(self, img):
+        """
+        Counts vehicles per lane in the next frame of the stream.
+
+        Args:
+            img: BGR (or grayscale) frame
+
+        Returns:
+            List of vehicle counts per lane
+        """
+        gray = _to_gray(img)
+        self.frames += 1
+
+        if self._reference is None or self._reference.shape != gray.shape:
+            self._compile(gray.shape)
+            self._reference = gray.copy()
+            self._counts = self.geometry.count(_blob_centroids(gray, self.min_area), gray.shape)
+            self.lanes_detected += self.num_lanes
+            return self._counts.tolist()
+
+        # Fraction of changed pixels per lane
+        changed = cv2.absdiff(gray, self._reference) > self.pixel_threshold
+        changed_per_lane = np.bincount(self._labels[changed] + 1, minlength=self.num_lanes + 1)[1:]
+        fraction = changed_per_lane / np.maximum(self._areas, 1)
+
+        # Full-frame blobs, labelled at most once and only if a window cuts a blob
+        frame_points = None
+        for lane in np.flatnonzero(fraction > self.change_threshold):
+            points = frame_points if frame_points is not None else self._window_centroids(gray, lane)
+            if points is None:
+                frame_points = points = _blob_centroids(gray, self.min_area)
+                self.full_recounts += 1
+            self._counts[lane] = np.count_nonzero(self.geometry.assign(points, gray.shape) == lane)
+
+            x0, y0, x1, y1 = self._bounds[lane]
+            in_lane = self._labels[y0:y1, x0:x1] == lane
+            self._reference[y0:y1, x0:x1][in_lane] = gray[y0:y1, x0:x1][in_lane]
+            self.lanes_detected += 1
+
+        return self._counts.tolist()
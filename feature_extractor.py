@@ -1,23 +1,209 @@
 import cv2
+import io
 import numpy as np
 import os
+from concurrent.futures import ProcessPoolExecutor
+from dataset import PackedDataset
+from detector import count_vehicles, MIN_AREA
+from lane_geometry import get_geometry
+from model_registry import write_atomic
 
-def extract_counts():
+# Congestion labels; features.npz stores y as indices into this array
+LABELS = np.array(['low', 'med', 'high'])
+
+# Plain .npy copies of X and y written next to features.npz for memory-mapping
+FEATURES_X_FILE = 'features_X.npy'
+FEATURES_Y_FILE = 'features_y.npy'
+
+def label_codes(totals):
+    """
+    Maps total vehicle counts to congestion label codes.
+
+    Args:
+        totals: Array of true vehicle totals per frame
+
+    Returns:
+        int8 array of indices into LABELS (<=10 low, <=20 med, otherwise high)
+    """
+    return np.digitize(np.asarray(totals), [10, 20], right=True).astype(np.int8)
+
+def _count_file(img_path, geometry):
+    """Returns per-lane counts for one image, or None if it can't be read."""
+    if not os.path.exists(img_path):
+        print(f"Warning: Image not found: {img_path}")
+        return None
+
+    img = cv2.imread(img_path)
+    if img is None:
+        print(f"Warning: Failed to read image: {img_path}")
+        return None
+
+    return count_vehicles(img, geometry=geometry)
+
+def _extract_chunk(img_paths, geometry):
+    """
+    Counts vehicles for a chunk of images (runs inside a worker process).
+
+    Returns:
+        (counts, valid) where counts is an (n, num_lanes) int32 array and
+        valid marks the images that could be read
+    """
+    counts = np.zeros((len(img_paths), geometry.num_lanes), dtype=np.int32)
+    valid = np.zeros(len(img_paths), dtype=bool)
+    for i, img_path in enumerate(img_paths):
+        lane_counts = _count_file(img_path, geometry)
+        if lane_counts is not None:
+            counts[i] = lane_counts
+            valid[i] = True
+    return counts, valid
+
+def _extract_packed_chunk(directory, start, stop, geometry):
+    """Counts vehicles for frames start..stop-1 of a packed dataset."""
+    dataset = PackedDataset(directory)
+    counts = np.zeros((stop - start, geometry.num_lanes), dtype=np.int32)
+    for offset, frames, _ in dataset.iter_batches(start=start, stop=stop):
+        for i, frame in enumerate(frames, offset - start):
+            counts[i] = count_vehicles(frame, geometry=geometry)
+    return counts
+
+def _extract_packed(directory, geometry, workers, chunk_size):
+    """Counts vehicles for every frame of a packed dataset, optionally across a process pool."""
+    num_frames = len(PackedDataset(directory))
+    X = np.zeros((num_frames, geometry.num_lanes), dtype=np.int32)
+
+    if workers is None or workers < 1:
+        workers = os.cpu_count() or 1
+
+    if workers == 1 or num_frames <= chunk_size:
+        X[:] = _extract_packed_chunk(directory, 0, num_frames, geometry)
+        return X
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = {}
+        for start in range(0, num_frames, chunk_size):
+            stop = min(start + chunk_size, num_frames)
+            futures[start] = executor.submit(_extract_packed_chunk, directory, start, stop, geometry)
+        for start, future in futures.items():
+            counts = future.result()
+            X[start:start + len(counts)] = counts
+    return X
+
+def _init_worker():
+    # One OpenCV thread per process; parallelism comes from the pool
+    cv2.setNumThreads(1)
+
+def _extract_paths(img_paths, geometry, workers, chunk_size):
+    """
+    Counts vehicles for every image path, optionally across a process pool.
+
+    Returns:
+        (X, valid) where X is a preallocated (N, num_lanes) int32 array and
+        valid marks the images that could be read
     """
-    Reads each synthetic frame, thresholds to binary,
-    finds contour centroids, and counts per lane.
+    X = np.zeros((len(img_paths), geometry.num_lanes), dtype=np.int32)
+    valid = np.zeros(len(img_paths), dtype=bool)
+
+    if workers is None or workers < 1:
+        workers = os.cpu_count() or 1
+
+    if workers == 1 or len(img_paths) <= chunk_size:
+        X[:], valid[:] = _extract_chunk(img_paths, geometry)
+        return X, valid
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = {}
+        for start in range(0, len(img_paths), chunk_size):
+            chunk = img_paths[start:start + chunk_size]
+            futures[start] = executor.submit(_extract_chunk, chunk, geometry)
+        for start, future in futures.items():
+            counts, ok = future.result()
+            X[start:start + len(counts)] = counts
+            valid[start:start + len(ok)] = ok
+    return X, valid
+
+def _load_index(index_path, settings):
+    """
+    Loads the per-image feature index.
+
+    Returns:
+        Dict mapping filename to ((size, mtime_ns), counts). Empty if the index
+        is missing, unreadable or was built with different detector settings.
+    """
+    if not os.path.exists(index_path):
+        return {}
+    try:
+        with np.load(index_path) as data:
+            if not np.array_equal(data['settings'], settings):
+                print("Detector settings changed, rebuilding feature index")
+                return {}
+            return {
+                fname: ((int(size), int(mtime)), counts)
+                for fname, size, mtime, counts in zip(
+                    data['filenames'], data['sizes'], data['mtimes'], data['counts'])
+            }
+    except Exception as e:
+        print(f"Warning: Ignoring unreadable feature index: {e}")
+        return {}
+
+def _save_npz(path, **arrays):
+    """Writes an .npz file atomically."""
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    write_atomic(path, buffer.getvalue())
+
+def _save_features(output_file, X, y, filenames):
+    """Writes features.npz plus the memory-mappable X and y arrays beside it."""
+    _save_npz(output_file, X=X, y=y, labels=LABELS, filenames=filenames)
+    directory = os.path.dirname(output_file)
+    for name, array in ((FEATURES_X_FILE, X), (FEATURES_Y_FILE, y)):
+        buffer = io.BytesIO()
+        np.save(buffer, array)
+        write_atomic(os.path.join(directory, name), buffer.getvalue())
+
+def extract_counts(workers=1, chunk_size=256, use_cache=True, packed=False, camera=None):
+    """
+    Reads each synthetic frame and counts vehicles per lane
+    with the shared detector.
     Labels total traffic as 'low', 'med', or 'high'.
+
+    Counts are kept in a per-image index (data/feature_index.npz) keyed by
+    filename, size and mtime, so a run only re-processes images that are new
+    or changed. Entries for images that no longer exist are dropped.
+
+    Args:
+        workers: Number of worker processes. 1 runs serially in this process,
+            None or a value below 1 uses every available core.
+        chunk_size: Number of images handed to a worker at a time
+        use_cache: If False, ignore the feature index and process every image
+        packed: Read frames from the packed dataset in data/packed instead of
+            loose images. Frames are streamed from the memory map, ground truth
+            comes from its counts array, and the feature index is not used.
+        camera: Camera whose lane geometry (data/lane_geometry.json) the frames
+            are counted with; None uses the default camera's, which falls
+            back to the simulator's vertical lanes
     """
-    # Must match simulator settings
-    num_lanes = 4
-    lane_width = 200
     input_dir = 'data'
     output_file = os.path.join(input_dir, 'features.npz')
+    index_path = os.path.join(input_dir, 'feature_index.npz')
+    geometry = get_geometry(camera)
+    settings = np.array([geometry.digest, str(MIN_AREA)])
 
     # Check if data directory exists
     if not os.path.exists(input_dir):
         raise FileNotFoundError(f"Data directory not found: {input_dir}")
 
+    if packed:
+        packed_dir = os.path.join(input_dir, 'packed')
+        dataset = PackedDataset(packed_dir)
+        X = _extract_packed(packed_dir, geometry, workers, chunk_size)
+        y = label_codes(np.asarray(dataset.counts).sum(axis=1))
+        try:
+            _save_features(output_file, X, y, dataset.filenames)
+            print(f"Extracted {len(X)} samples to '{output_file}'")
+        except Exception as e:
+            print(f"Error saving features: {e}")
+        return
+
     metadata_path = os.path.join(input_dir, 'metadata.npy')
     if not os.path.exists(metadata_path):
         raise FileNotFoundError(f"Metadata file not found: {metadata_path}")
@@ -28,56 +214,110 @@ def extract_counts():
     except Exception as e:
         raise Exception(f"Error loading metadata: {e}")
 
-    X, y = [], []
+    # Stat every frame; missing ones are skipped
+    fnames, totals, signatures = [], [], []
     for fname, true_counts in metadata:
         img_path = os.path.join(input_dir, fname)
-        if not os.path.exists(img_path):
+        try:
+            st = os.stat(img_path)
+        except FileNotFoundError:
             print(f"Warning: Image not found: {img_path}")
             continue
+        fnames.append(str(fname))
+        totals.append(sum(true_counts))
+        signatures.append((st.st_size, st.st_mtime_ns))
 
-        img = cv2.imread(img_path)
-        if img is None:
-            print(f"Warning: Failed to read image: {img_path}")
-            continue
+    index = _load_index(index_path, settings) if use_cache else {}
 
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        _, thresh = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
-        contours, _ = cv2.findContours(
-            thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-        )
-
-        # Count vehicles per lane
-        counts = [0] * num_lanes
-        for cnt in contours:
-            M = cv2.moments(cnt)
-            if M["m00"] == 0:
-                continue
-            cx = int(M["m10"] / M["m00"])
-            lane = min(cx // lane_width, num_lanes - 1)
-            counts[lane] += 1
-
-        X.append(counts)
-        total = sum(true_counts)
-        if total <= 10:
-            y.append("low")
-        elif total <= 20:
-            y.append("med")
+    # Preallocated output; cached rows are filled directly
+    X = np.zeros((len(fnames), geometry.num_lanes), dtype=np.int32)
+    valid = np.zeros(len(fnames), dtype=bool)
+    stale = []
+    for i, (fname, signature) in enumerate(zip(fnames, signatures)):
+        cached = index.get(fname)
+        if cached is not None and cached[0] == signature:
+            X[i] = cached[1]
+            valid[i] = True
         else:
-            y.append("high")
+            stale.append(i)
+
+    if stale:
+        stale_paths = [os.path.join(input_dir, fnames[i]) for i in stale]
+        counts, ok = _extract_paths(stale_paths, geometry, workers, chunk_size)
+        X[stale] = counts
+        valid[stale] = ok
+    print(f"Processed {len(stale)} new or changed images, reused {len(fnames) - len(stale)} cached")
+
+    fnames = np.array(fnames, dtype=str)
+    signatures = np.array(signatures, dtype=np.int64).reshape(-1, 2)
+
+    # Rewrite the index with the images that exist now
+    try:
+        _save_npz(index_path, settings=settings, filenames=fnames[valid],
+                  sizes=signatures[valid, 0], mtimes=signatures[valid, 1], counts=X[valid])
+    except Exception as e:
+        print(f"Warning: Failed to save feature index: {e}")
 
-    X_array = np.array(X, dtype=object)
-    y_array = np.array(y, dtype=object)
+    X = X[valid]
+    y = label_codes(np.array(totals, dtype=np.int64)[valid])
 
-    if not X:
+    if len(X) == 0:
         print("Warning: No features extracted!")
         return
 
     try:
-        np.savez( output_file, X = X_array, y = y_array)
+        _save_features(output_file, X, y, fnames[valid])
         print(f"Extracted {len(X)} samples to '{output_file}'")
     except Exception as e:
         print(f"Error saving features: {e}")
 
+def load_features(features_path=os.path.join('data', 'features.npz')):
+    """
+    Loads extracted features.
+
+    Args:
+        features_path: Path to features.npz
+
+    Returns:
+        (X, y) where X is an integer (N, num_lanes) array and y the label names
+    """
+    if not os.path.exists(features_path):
+        raise FileNotFoundError(f"Features file not found: {features_path}")
+
+    with np.load(features_path) as data:
+        if 'labels' in data.files:
+            return data['X'], data['labels'][data['y']]
+
+    # Older files store X and y as pickled object arrays
+    with np.load(features_path, allow_pickle=True) as data:
+        return data['X'].astype(np.int32), data['y'].astype(str)
+
+def open_feature_arrays(data_dir='data'):
+    """
+    Memory-maps the numeric feature arrays written alongside features.npz.
+
+    Only the rows that are actually indexed are read from disk, so training
+    sets larger than memory (for example many cameras over many days, written
+    with np.lib.format.open_memmap in the same layout) can be used directly.
+
+    Args:
+        data_dir: Directory containing features_X.npy and features_y.npy
+
+    Returns:
+        (X, y) memory maps, where X is (N, num_lanes) counts and y int8 indices
+        into LABELS, or None if the files don't exist
+    """
+    x_path = os.path.join(data_dir, FEATURES_X_FILE)
+    y_path = os.path.join(data_dir, FEATURES_Y_FILE)
+    if not os.path.exists(x_path) or not os.path.exists(y_path):
+        return None
+
+    X = np.load(x_path, mmap_mode='r')
+    y = np.load(y_path, mmap_mode='r')
+    if X.ndim != 2 or y.shape != (X.shape[0],):
+        raise ValueError(f"Feature arrays in {data_dir} have mismatched shapes {X.shape} and {y.shape}")
+    return X, y
+
 if __name__ == '__main__':
     try:
         extract_counts()
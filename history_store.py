@@ -0,0 +1,264 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_HISTORY_PATH = os.path.join('output', 'history.sqlite')
+
+# Rollup granularities in seconds (hour, UTC day); whole buckets never touch raw rows
+ROLLUP_SIZES = (3600, 86400)
+
+# Raw per-frame rows older than this (seconds) are deleted; rollups are kept forever
+RAW_RETENTION = 7 * 24 * 3600
+# Appends between retention passes
+PRUNE_EVERY = 1000
+# Raw rows deleted per transaction while pruning, so writers are never held up for long
+PRUNE_BATCH = 5000
+
+# Percentiles reported by aggregate()
+PERCENTILES = (50, 90, 95)
+
+# Bucket sizes accepted by series(), each backed by a rollup tier
+SERIES_INTERVALS = {'hour': 3600, 'day': 86400}
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS observations ('
+    'camera TEXT NOT NULL, ts REAL NOT NULL, lane INTEGER NOT NULL, '
+    'count INTEGER NOT NULL, green INTEGER NOT NULL, prediction TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS observations_camera_ts ON observations (camera, ts)',
+    # Lets retention pruning find expired rows across all cameras without a scan
+    'CREATE INDEX IF NOT EXISTS observations_ts ON observations (ts)',
+    # Per camera, lane and bucket of each size: sample count, sum and maximum
+    # of vehicle counts, summed green time
+    'CREATE TABLE IF NOT EXISTS rollups ('
+    'camera TEXT NOT NULL, size INTEGER NOT NULL, bucket INTEGER NOT NULL, lane INTEGER NOT NULL, '
+    'n INTEGER NOT NULL, total INTEGER NOT NULL, peak INTEGER NOT NULL, green_total INTEGER NOT NULL, '
+    'PRIMARY KEY (camera, size, bucket, lane))',
+    # Per camera, lane and bucket: how many frames saw each vehicle count (for exact percentiles)
+    'CREATE TABLE IF NOT EXISTS rollup_hist ('
+    'camera TEXT NOT NULL, size INTEGER NOT NULL, bucket INTEGER NOT NULL, lane INTEGER NOT NULL, '
+    'value INTEGER NOT NULL, n INTEGER NOT NULL, '
+    'PRIMARY KEY (camera, size, bucket, lane, value))',
+)
+
+def _percentile(histogram, q):
+    """Nearest-rank percentile of a {value: frequency} histogram."""
+    total = sum(histogram.values())
+    rank = max(1, math.ceil(q / 100 * total))
+    seen = 0
+    for value in sorted(histogram):
+        seen += histogram[value]
+        if seen >= rank:
+            return value
+    return None
+
+def _plan(start, end):
+    """
+    Splits [start, end) into ranges answered by the coarsest rollup that fits.
+
+    Returns:
+        List of (size, lo, hi); size is None for the partial-bucket edges that
+        have to be read from raw rows
+    """
+    ranges = [(None, start, end)]
+    for size in sorted(ROLLUP_SIZES, reverse=True):
+        split = []
+        for tier, lo, hi in ranges:
+            first = math.ceil(lo / size) * size
+            last = math.floor(hi / size) * size
+            if tier is not None or first >= last:
+                split.append((tier, lo, hi))
+            else:
+                split += [(None, lo, first), (size, first, last), (None, last, hi)]
+        ranges = split
+    return [(tier, lo, hi) for tier, lo, hi in ranges if lo < hi]
+
+class HistoryStore:
+    """
+    Append-only SQLite log of analysis results with hourly and daily rollups.
+
+    Every result is stored as one raw row per lane, indexed by camera and
+    timestamp. The same write also folds it into hourly and daily rollups:
+    running count/sum/peak per lane and a histogram of vehicle counts. Counts
+    are small integers, so the histograms are compact and give exact
+    percentiles.
+
+    Aggregate queries read daily rollups for whole days in the window, hourly
+    rollups for the whole hours around them and raw rows only for the partial
+    hours at either edge, so the cost depends on the number of days, not the
+    number of frames. Raw rows older than raw_retention are pruned on a
+    background thread, off the request path; rollups are kept.
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH, raw_retention=RAW_RETENTION):
+        self.path = path
+        self.raw_retention = raw_retention
+        self._local = threading.local()
+        self._appends = 0
+        self._pruning = threading.Lock()
+
+    def _connection(self):
+        """Returns this thread's connection, opening it on first use (also after a fork)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def record(self, camera, counts, prediction, timings, timestamp=None):
+        """
+        Appends one analysis result.
+
+        Args:
+            camera: Camera identifier
+            counts: Vehicle counts per lane
+            prediction: Congestion prediction
+            timings: Timings dict from calculate_traffic_light_timings_per_lane
+            timestamp: Unix time of the frame (defaults to now)
+        """
+        ts = time.time() if timestamp is None else float(timestamp)
+        buckets = [(size, int(ts // size * size)) for size in ROLLUP_SIZES]
+        lanes = [(lane, int(count), int(timings[str(lane)]['green'])) for lane, count in enumerate(counts)]
+
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('INSERT INTO observations VALUES (?, ?, ?, ?, ?, ?)',
+                             [(camera, ts, lane, count, green, str(prediction)) for lane, count, green in lanes])
+            conn.executemany(
+                'INSERT INTO rollups VALUES (?, ?, ?, ?, 1, ?, ?, ?) '
+                'ON CONFLICT (camera, size, bucket, lane) DO UPDATE SET n = n + 1, '
+                'total = total + excluded.total, peak = max(peak, excluded.peak), '
+                'green_total = green_total + excluded.green_total',
+                [(camera, size, bucket, lane, count, count, green)
+                 for size, bucket in buckets for lane, count, green in lanes])
+            conn.executemany(
+                'INSERT INTO rollup_hist VALUES (?, ?, ?, ?, ?, 1) '
+                'ON CONFLICT (camera, size, bucket, lane, value) DO UPDATE SET n = n + 1',
+                [(camera, size, bucket, lane, count) for size, bucket in buckets for lane, count, _ in lanes])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        self._appends += 1
+        if self.raw_retention and self._appends % PRUNE_EVERY == 0 and self._pruning.acquire(blocking=False):
+            threading.Thread(target=self._prune, name='history-prune', daemon=True).start()
+
+    def _prune(self):
+        """
+        Deletes raw rows older than raw_retention (runs on a background thread).
+
+        Rows go in batches of PRUNE_BATCH, each its own short transaction, so
+        other writers get the lock between batches.
+        """
+        try:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            try:
+                cutoff = time.time() - self.raw_retention
+                while conn.execute(
+                        'DELETE FROM observations WHERE rowid IN '
+                        '(SELECT rowid FROM observations WHERE ts < ? LIMIT ?)',
+                        (cutoff, PRUNE_BATCH)).rowcount == PRUNE_BATCH:
+                    pass
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Warning: Failed to prune analysis history: {e}")
+        finally:
+            self._pruning.release()
+
+    def cameras(self):
+        """Returns every camera with recorded history."""
+        rows = self._connection().execute('SELECT DISTINCT camera FROM rollups ORDER BY camera')
+        return [row[0] for row in rows]
+
+    def aggregate(self, camera, start, end):
+        """
+        Per-lane statistics over the window [start, end).
+
+        Args:
+            camera: Camera identifier
+            start: Window start, Unix seconds
+            end: Window end, Unix seconds
+
+        Returns:
+            List of dicts per lane with samples, mean, p50, p90, p95, peak
+            (vehicle counts) and mean_green (seconds)
+        """
+        conn = self._connection()
+        histograms, green = {}, {}
+
+        for size, lo, hi in _plan(start, end):
+            if size is None:
+                rows = conn.execute(
+                    'SELECT lane, count, COUNT(*) FROM observations '
+                    'WHERE camera = ? AND ts >= ? AND ts < ? GROUP BY lane, count', (camera, lo, hi))
+                green_rows = conn.execute(
+                    'SELECT lane, SUM(green) FROM observations '
+                    'WHERE camera = ? AND ts >= ? AND ts < ? GROUP BY lane', (camera, lo, hi))
+            else:
+                rows = conn.execute(
+                    'SELECT lane, value, SUM(n) FROM rollup_hist '
+                    'WHERE camera = ? AND size = ? AND bucket >= ? AND bucket < ? GROUP BY lane, value',
+                    (camera, size, lo, hi))
+                green_rows = conn.execute(
+                    'SELECT lane, SUM(green_total) FROM rollups '
+                    'WHERE camera = ? AND size = ? AND bucket >= ? AND bucket < ? GROUP BY lane',
+                    (camera, size, lo, hi))
+            for lane, value, n in rows:
+                hist = histograms.setdefault(lane, {})
+                hist[value] = hist.get(value, 0) + n
+            for lane, green_total in green_rows:
+                green[lane] = green.get(lane, 0) + green_total
+
+        lanes = []
+        for lane in sorted(histograms):
+            hist = histograms[lane]
+            samples = sum(hist.values())
+            stats = {
+                'lane': lane,
+                'samples': samples,
+                'mean': sum(value * n for value, n in hist.items()) / samples,
+                'peak': max(hist),
+                'mean_green': green[lane] / samples,
+            }
+            for q in PERCENTILES:
+                stats[f'p{q}'] = _percentile(hist, q)
+            lanes.append(stats)
+        return lanes
+
+    def series(self, camera, start, end, interval='hour'):
+        """
+        Per-lane mean and peak counts per hour or day, read from the rollups.
+
+        Buckets are aligned to whole hours (or UTC days), so the first and last
+        may extend past start and end.
+
+        Returns:
+            List of {'start': bucket start, 'lanes': [{'lane', 'samples', 'mean', 'peak'}]}
+        """
+        if interval not in SERIES_INTERVALS:
+            raise ValueError(f"interval must be one of {', '.join(SERIES_INTERVALS)}")
+        size = SERIES_INTERVALS[interval]
+        first = math.floor(start / size) * size
+
+        series = {}
+        for bucket, lane, n, total, peak in self._connection().execute(
+                'SELECT bucket, lane, n, total, peak FROM rollups '
+                'WHERE camera = ? AND size = ? AND bucket >= ? AND bucket < ? ORDER BY bucket, lane',
+                (camera, size, first, end)):
+            series.setdefault(bucket, []).append(
+                {'lane': lane, 'samples': n, 'mean': total / n, 'peak': peak})
+        return [{'start': bucket, 'lanes': lanes} for bucket, lanes in series.items()]
@@ -0,0 +1,199 @@
+import base64
+import bisect
+import json
+import os
+import threading
+import time
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Page size limits for query()
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Sort orders accepted by query()
+SORT_ORDERS = ('name', 'mtime')
+
+# A directory modified this recently may still change within the same mtime
+# tick, so its mtime is not trusted until it is older than this (seconds)
+RACY_WINDOW = 2.0
+
+def encode_cursor(order, key):
+    """Packs a sort key into an opaque URL-safe cursor string."""
+    payload = json.dumps([order, list(key) if isinstance(key, tuple) else key])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, order):
+    """
+    Unpacks a cursor made by encode_cursor for the given sort order.
+
+    Raises:
+        ValueError: If the cursor is malformed or belongs to another sort order
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_order, key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if cursor_order != order:
+        raise ValueError("Cursor was issued for a different sort order")
+    if order == 'mtime':
+        if not (isinstance(key, list) and len(key) == 2):
+            raise ValueError("Invalid cursor")
+        return (int(key[0]), str(key[1]))
+    return str(key)
+
+class ImageIndex:
+    """
+    In-memory listing of the images in a directory, kept sorted by name and by
+    modification time.
+
+    Adding, removing or renaming a file changes the directory's mtime, so a
+    refresh is a single stat() when nothing changed. When it did change, the
+    files are re-listed and stat()ed, and the sorted lists are rebuilt by
+    merging in only the entries that are new or whose mtime changed. Files
+    replaced through a rename (as write_atomic does) change the directory and
+    are picked up; a file modified in place without touching the directory
+    keeps its indexed mtime until the directory next changes.
+
+    The sorted lists are replaced, never mutated, so queries can read them
+    without holding the lock.
+    """
+
+    def __init__(self, directory='data', extensions=IMAGE_EXTENSIONS):
+        self.directory = directory
+        self.extensions = extensions
+        self._lock = threading.Lock()
+        self._dir_mtime = None
+        self._mtimes = {}       # name -> mtime_ns
+        self._by_name = []      # sorted names
+        self._by_mtime = []     # sorted (mtime_ns, name)
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def refresh(self):
+        """Brings the index up to date with the directory if it has changed."""
+        try:
+            dir_mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            dir_mtime = None
+        if dir_mtime is not None and dir_mtime == self._dir_mtime:
+            return
+
+        with self._lock:
+            if dir_mtime is not None and dir_mtime == self._dir_mtime:
+                return
+
+            mtimes = {}
+            if dir_mtime is not None:
+                with os.scandir(self.directory) as entries:
+                    for entry in entries:
+                        if not entry.name.lower().endswith(self.extensions):
+                            continue
+                        try:
+                            mtimes[entry.name] = entry.stat().st_mtime_ns
+                        except FileNotFoundError:
+                            continue
+
+            removed = self._mtimes.keys() - mtimes.keys()
+            # New files and files rewritten since they were indexed
+            changed = {name: mtime for name, mtime in mtimes.items() if self._mtimes.get(name) != mtime}
+
+            if removed or changed:
+                # Both lists are already sorted, so sorting the concatenation is a linear merge
+                kept_names = [name for name in self._by_name if name not in removed]
+                kept_mtimes = [item for item in self._by_mtime
+                               if item[1] not in removed and item[1] not in changed]
+                self._by_name = sorted(kept_names + sorted(changed.keys() - self._mtimes.keys()))
+                self._by_mtime = sorted(kept_mtimes + sorted((m, n) for n, m in changed.items()))
+                self._mtimes = mtimes
+
+            # Leave the signature unset while the directory may still change within its mtime tick
+            racy = dir_mtime is not None and time.time_ns() - dir_mtime < RACY_WINDOW * 1e9
+            self._dir_mtime = None if racy else dir_mtime
+
+    def names(self):
+        """Returns every indexed image name in name order."""
+        self.refresh()
+        return list(self._by_name)
+
+    def mtime(self, name):
+        """Returns the indexed modification time of name in nanoseconds, or None."""
+        return self._mtimes.get(name)
+
+    def query(self, cursor=None, limit=DEFAULT_PAGE_SIZE, order='name', descending=False,
+              prefix=None, since=None, until=None):
+        """
+        Returns one page of image names.
+
+        Pagination is keyset-based: the cursor holds the sort key of the last
+        image returned, so pages stay consistent while images are added or
+        removed.
+
+        Args:
+            cursor: next_cursor from the previous page, or None for the first page
+            limit: Maximum number of names to return (capped at MAX_PAGE_SIZE)
+            order: 'name' or 'mtime'
+            descending: Reverse the sort order
+            prefix: Only include names starting with this string
+            since: Only include images modified at or after this Unix time (seconds)
+            until: Only include images modified at or before this Unix time (seconds)
+
+        Returns:
+            dict with 'images' (list of names), 'next_cursor' (None on the last
+            page) and 'total' (number of images in the directory)
+
+        Raises:
+            ValueError: On an unknown sort order or invalid cursor
+        """
+        if order not in SORT_ORDERS:
+            raise ValueError(f"order must be one of {', '.join(SORT_ORDERS)}")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        since_ns = None if since is None else int(since * 1e9)
+        until_ns = None if until is None else int(until * 1e9)
+
+        self.refresh()
+        mtimes = self._mtimes
+        keys = self._by_name if order == 'name' else self._by_mtime
+        lo, hi = 0, len(keys)
+
+        # Narrow the range with binary search on whichever filter matches the sort key
+        if order == 'name':
+            if prefix:
+                lo = bisect.bisect_left(keys, prefix)
+                hi = bisect.bisect_left(keys, prefix + '\U0010ffff')
+        else:
+            if since_ns is not None:
+                lo = bisect.bisect_left(keys, (since_ns,))
+            if until_ns is not None:
+                hi = bisect.bisect_left(keys, (until_ns + 1,))
+
+        if cursor:
+            key = decode_cursor(cursor, order)
+            if descending:
+                hi = min(hi, bisect.bisect_left(keys, key))
+            else:
+                lo = max(lo, bisect.bisect_right(keys, key))
+
+        positions = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+        page = []
+        for position in positions:
+            key = keys[position]
+            name = key if order == 'name' else key[1]
+            if prefix and not name.startswith(prefix):
+                continue
+            mtime = mtimes.get(name, 0)
+            if (since_ns is not None and mtime < since_ns) or (until_ns is not None and mtime > until_ns):
+                continue
+            page.append(key)
+            if len(page) > limit:
+                break
+
+        next_cursor = None
+        if len(page) > limit:
+            page.pop()
+            next_cursor = encode_cursor(order, page[-1])
+
+        names = page if order == 'name' else [key[1] for key in page]
+        return {'images': names, 'next_cursor': next_cursor, 'total': len(keys)}
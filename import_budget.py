@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+DEFAULT_BUDGET = 'import_budget.json'
+
+def parse_importtime(stderr):
+    """
+    Parses the output of python -X importtime.
+
+    Returns:
+        List of (module, self_us, cumulative_us, depth) in import order
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+def measure(module, runs=5, cwd=None):
+    """
+    Imports module in fresh interpreters and reports its cost.
+
+    Args:
+        module: Module name to import
+        runs: Number of fresh interpreters; the median is reported
+        cwd: Directory the interpreters run in (defaults to this file's directory)
+
+    Returns:
+        dict with 'ms' (median cumulative import time of module), 'modules'
+        (every module it pulled in) and 'slowest' ((name, self ms) of the
+        slowest imports in the median run)
+    """
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                cwd=cwd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"Importing {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+        entries = parse_importtime(result.stderr)
+        top = [e for e in entries if e[0] == module and e[3] == 0]
+        if not top:
+            raise Exception(f"No import timing found for {module}")
+        samples.append((top[-1][2], entries))
+
+    samples.sort(key=lambda sample: sample[0])
+    cumulative_us, entries = samples[len(samples) // 2]
+    slowest = sorted(entries, key=lambda e: e[1], reverse=True)[:10]
+    return {
+        'ms': cumulative_us / 1000,
+        'modules': {e[0] for e in entries},
+        'slowest': [(e[0], e[1] / 1000) for e in slowest],
+    }
+
+def check_budget(budget, runs=5, top=0):
+    """
+    Measures every module in the budget and compares it with its limits.
+
+    Args:
+        budget: Parsed budget file ({'modules': {name: {'max_ms', 'forbidden'}}})
+        runs: Fresh interpreters per module
+        top: Number of slowest imports to print per module
+
+    Returns:
+        (report, violations) where report maps module to its measured ms and
+        violations is a list of messages
+    """
+    report, violations = {}, []
+    for module, limits in budget['modules'].items():
+        result = measure(module, runs)
+        report[module] = result['ms']
+
+        max_ms = limits.get('max_ms')
+        status = 'ok'
+        if max_ms is not None and result['ms'] > max_ms:
+            status = 'OVER'
+            violations.append(f"{module}: {result['ms']:.1f} ms exceeds budget of {max_ms} ms")
+
+        for package in limits.get('forbidden', []):
+            pulled = sorted(m for m in result['modules'] if m == package or m.startswith(package + '.'))
+            if pulled:
+                status = 'FORBIDDEN'
+                violations.append(f"{module}: imports {package} ({pulled[0]})")
+
+        budget_text = f"{max_ms} ms" if max_ms is not None else '-'
+        print(f"  {module:20s} {result['ms']:8.1f} ms   budget {budget_text:>8s}   {status}")
+        for name, ms in result['slowest'][:top]:
+            print(f"      {ms:8.1f} ms  {name}")
+    return report, violations
+
+def main():
+    parser = argparse.ArgumentParser(description='Check module import times against a startup budget')
+    parser.add_argument('--budget', type=str, default=DEFAULT_BUDGET, help='Budget JSON file')
+    parser.add_argument('--runs', type=int, default=None, help='Fresh interpreters per module (median is used)')
+    parser.add_argument('--top', type=int, default=0, help='Show the N slowest imports for each module')
+    parser.add_argument('--output', type=str, default=None, help='Write measured times to this JSON file')
+    args = parser.parse_args()
+
+    with open(args.budget) as f:
+        budget = json.load(f)
+
+    runs = args.runs or budget.get('runs', 5)
+    print(f"Import times (median of {runs} fresh interpreters):")
+    report, violations = check_budget(budget, runs, args.top)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if violations:
+        print("\nBudget violations:")
+        for message in violations:
+            print(f"  {message}")
+        sys.exit(1)
+    print("\nAll modules within budget")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+import cv2
+import numpy as np
+from model_registry import get_registry
+
+# Default lane layout: vertical strips, as drawn by data_generator
+NUM_LANES = 4
+LANE_WIDTH = 200
+
+# Per-camera lane polygons; cameras without an entry use DEFAULT_CAMERA's
+DEFAULT_GEOMETRY_PATH = os.path.join('data', 'lane_geometry.json')
+
+# Camera assumed for frames and analyses that don't name one
+DEFAULT_CAMERA = 'default'
+
+# Coordinate used for the open-ended edges of strip lanes (clipped to the frame)
+_FAR = 1 << 20
+
+class LaneGeometry:
+    """
+    Lane layout of one camera as a polygon per lane.
+
+    The polygons are compiled once per frame size into a lane-label image
+    holding, for every pixel, the index of the lane it belongs to (or -1
+    outside every lane). Assigning detected blobs to lanes is then a single
+    array lookup at their centroids, whatever the shape of the lanes. Where
+    polygons overlap, the later lane wins.
+
+    Polygons are drawn for a reference frame size; frames of another size use
+    them scaled to fit. Without a size, coordinates are used as-is.
+    """
+
+    def __init__(self, polygons, size=None, names=None):
+        """
+        Args:
+            polygons: One list of [x, y] vertices (at least three) per lane
+            size: (width, height) the polygons were drawn for, or None
+            names: Optional display name per lane
+        """
+        if not polygons:
+            raise ValueError("A lane geometry needs at least one lane")
+        self.polygons = []
+        for lane, polygon in enumerate(polygons):
+            points = np.asarray(polygon, dtype=np.float64)
+            if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+                raise ValueError(f"Lane {lane} must be a polygon of at least three [x, y] points")
+            self.polygons.append(points)
+        if size is not None and (len(size) != 2 or min(size) <= 0):
+            raise ValueError(f"Invalid reference size: {size}")
+        self.size = None if size is None else (int(size[0]), int(size[1]))
+        self.names = list(names) if names else [f"Lane {lane + 1}" for lane in range(len(polygons))]
+        if len(self.names) != len(self.polygons):
+            raise ValueError("names must have one entry per lane")
+        self.num_lanes = len(self.polygons)
+
+        spec = {'polygons': [p.tolist() for p in self.polygons], 'size': self.size}
+        self.digest = hashlib.blake2b(json.dumps(spec).encode(), digest_size=8).hexdigest()
+        self._compiled = {}
+
+    def __getstate__(self):
+        # Label maps are rebuilt on demand; don't ship them to worker processes
+        state = self.__dict__.copy()
+        state['_compiled'] = {}
+        return state
+
+    def frame_polygons(self, shape):
+        """
+        Returns the lane polygons in pixel coordinates of a frame.
+
+        Args:
+            shape: Frame shape (height, width[, channels])
+
+        Returns:
+            List of (k, 2) int32 vertex arrays
+        """
+        height, width = shape[:2]
+        scale = (1.0, 1.0) if self.size is None else (width / self.size[0], height / self.size[1])
+        return [np.round(points * scale).astype(np.int32) for points in self.polygons]
+
+    def label_map(self, shape):
+        """
+        Returns the lane-label image for a frame shape, compiling it on first use.
+
+        Returns:
+            (height, width) int16 array of lane indices, -1 outside every lane
+        """
+        key = tuple(shape[:2])
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            labels = np.full(key, -1, dtype=np.int16)
+            for lane, polygon in enumerate(self.frame_polygons(shape)):
+                cv2.fillPoly(labels, [polygon], lane)
+            labels.setflags(write=False)
+            compiled = self._compiled[key] = labels
+        return compiled
+
+    def lane_bounds(self, shape):
+        """
+        Returns the bounding box of each lane within a frame.
+
+        Returns:
+            (num_lanes, 4) array of [x0, y0, x1, y1) boxes clipped to the frame
+        """
+        height, width = shape[:2]
+        bounds = np.zeros((self.num_lanes, 4), dtype=np.int64)
+        for lane, polygon in enumerate(self.frame_polygons(shape)):
+            bounds[lane] = [polygon[:, 0].min(), polygon[:, 1].min(),
+                            polygon[:, 0].max() + 1, polygon[:, 1].max() + 1]
+        bounds[:, [0, 2]] = bounds[:, [0, 2]].clip(0, width)
+        bounds[:, [1, 3]] = bounds[:, [1, 3]].clip(0, height)
+        return bounds
+
+    def assign(self, points, shape):
+        """
+        Returns the lane of each point.
+
+        Args:
+            points: (N, 2) array of x, y pixel coordinates (e.g. blob centroids)
+            shape: Shape of the frame the points come from
+
+        Returns:
+            (N,) int array of lane indices, -1 for points outside every lane
+        """
+        labels = self.label_map(shape)
+        points = np.asarray(points)
+        x = points[:, 0].astype(np.int64).clip(0, labels.shape[1] - 1)
+        y = points[:, 1].astype(np.int64).clip(0, labels.shape[0] - 1)
+        return labels[y, x]
+
+    def count(self, points, shape):
+        """
+        Counts points per lane; points outside every lane are ignored.
+
+        Returns:
+            (num_lanes,) int array of counts
+        """
+        lanes = self.assign(points, shape)
+        return np.bincount(lanes[lanes >= 0], minlength=self.num_lanes)
+
+@lru_cache(maxsize=None)
+def vertical_strips(num_lanes=NUM_LANES, lane_width=LANE_WIDTH):
+    """
+    Returns the geometry of num_lanes vertical strips lane_width pixels wide.
+
+    The last lane extends to the right edge of the frame, whatever its width.
+    """
+    polygons = []
+    for lane in range(num_lanes):
+        x0 = lane * lane_width
+        x1 = _FAR if lane == num_lanes - 1 else x0 + lane_width - 1
+        polygons.append([[x0, 0], [x1, 0], [x1, _FAR], [x0, _FAR]])
+    return LaneGeometry(polygons)
+
+def parse_geometry_config(data):
+    """
+    Parses a lane geometry file.
+
+    The file maps camera IDs to a reference frame size and a polygon per lane:
+
+        {"cameras": {"north-gate": {"size": [1280, 720],
+                                    "lanes": [{"name": "Left turn", "polygon": [[x, y], ...]}, ...]}}}
+
+    Args:
+        data: JSON bytes
+
+    Returns:
+        dict of camera ID -> LaneGeometry
+    """
+    config = json.loads(data)
+    geometries = {}
+    for camera, spec in config.get('cameras', {}).items():
+        try:
+            lanes = spec['lanes']
+            geometries[camera] = LaneGeometry([lane['polygon'] for lane in lanes], spec.get('size'),
+                                              [lane.get('name', f"Lane {i + 1}") for i, lane in enumerate(lanes)])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid lane geometry for camera '{camera}': {e}")
+    return geometries
+
+def get_geometry(camera=None, path=DEFAULT_GEOMETRY_PATH):
+    """
+    Returns the lane geometry of a camera.
+
+    The geometry file is loaded through the model registry, so it is parsed
+    once, shared by every caller and picked up again when it changes. Cameras
+    without an entry use the DEFAULT_CAMERA entry, and without that (or
+    without a file) the default vertical strips.
+
+    Args:
+        camera: Camera ID (None for the default camera)
+        path: Lane geometry JSON file
+
+    Returns:
+        LaneGeometry
+    """
+    if not os.path.exists(path):
+        return vertical_strips()
+    geometries = get_registry().get(path, loader=parse_geometry_config)
+    geometry = geometries.get(camera or DEFAULT_CAMERA) or geometries.get(DEFAULT_CAMERA)
+    return geometry or vertical_strips()
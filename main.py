@@ -1,10 +1,11 @@
 import os
+import sys
 import argparse
-from data_generator import generate_traffic_data
-from feature_extractor import extract_counts
-from model_trainer import train_traffic_model
-from traffic_predictor import predict_traffic
-from visualizer import visualize_traffic, visualize_dataset_summary
+import contextlib
+
+# Pipeline modules are imported inside the steps that use them, so a single
+# subcommand (e.g. --predict) doesn't pay for sklearn or matplotlib.
+# Check startup cost with: python import_budget.py
 
 def setup_environment():
     """Ensures required directories exist"""
@@ -24,30 +25,60 @@ def main():
     parser.add_argument('--visualize', action='store_true', help='Visualize results')
     parser.add_argument('--summary', action='store_true', help='Generate dataset summary')
     parser.add_argument('--all', action='store_true', help='Run the entire pipeline')
+    parser.add_argument('--stream', type=str, default=None,
+                        help='Analyze a video file or image directory and print JSON lines per frame')
+    parser.add_argument('--stride', type=int, default=1, help='Process every Nth frame with --stream')
+    parser.add_argument('--frame-diff', action='store_true',
+                        help='With --stream, only re-detect lanes that changed since the previous frame')
+    parser.add_argument('--camera', type=str, default=None,
+                        help='Camera ID whose lane geometry --stream uses (default: the default camera)')
+    parser.add_argument('--samples', type=int, default=5, help='Number of frames to generate')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for reproducible data generation')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes for data generation and feature extraction (0 = all cores)')
+    parser.add_argument('--packed', action='store_true',
+                        help='Generate and extract from the memory-mapped dataset in data/packed')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Ignore the feature cache and re-extract every image')
+    parser.add_argument('--search', action='store_true',
+                        help='Search model families and hyperparameters when training')
+    parser.add_argument('--time-budget', type=float, default=300, help='Seconds allowed for --search')
 
     args = parser.parse_args()
 
+    # With --stream, stdout carries the JSON lines, so status messages go to stderr
+    stream_output = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr if args.stream else sys.stdout):
+        run_pipeline(args, stream_output)
+
+def run_pipeline(args, stream_output):
+    """Runs the steps selected by the parsed command-line arguments"""
     # Ensure directories exist
     setup_environment()
 
     # Run all steps if --all is specified or no specific step is requested
     run_all = args.all or not any([args.generate, args.extract, args.train,
-                                  args.predict is not None, args.visualize, args.summary])
+                                  args.predict is not None, args.visualize, args.summary,
+                                  args.stream])
 
     # Generate data
     if args.generate or run_all:
         print("\n--- Generating Traffic Data ---")
-        generate_traffic_data(num_samples=5)
+        from data_generator import generate_traffic_data
+        generate_traffic_data(num_samples=args.samples, seed=args.seed, workers=args.workers,
+                              image_format='packed' if args.packed else 'png')
 
     # Extract features
     if args.extract or run_all:
         print("\n--- Extracting Features ---")
-        extract_counts()
+        from feature_extractor import extract_counts
+        extract_counts(workers=args.workers, use_cache=not args.rebuild, packed=args.packed)
 
     # Train model
     if args.train or run_all:
         print("\n--- Training Model ---")
-        train_traffic_model()
+        from model_trainer import train_traffic_model
+        train_traffic_model(search=args.search, time_budget=args.time_budget)
 
     # Make predictions
     prediction = None
@@ -56,6 +87,7 @@ def main():
 
     if args.predict is not None or run_all:
         print("\n--- Making Predictions ---")
+        from traffic_predictor import predict_traffic
         prediction, counts, image_path = predict_traffic(args.predict)
         print(f"Analyzed image: {image_path}")
         print(f"Lane counts: {counts}")
@@ -64,11 +96,21 @@ def main():
     # Visualize the prediction
     if (args.visualize or run_all) and prediction is not None:
         print("\n--- Visualizing Results ---")
+        from visualizer import visualize_traffic
         visualize_traffic(image_path, counts, prediction)
 
+    # Analyze a video or frame sequence
+    if args.stream:
+        print("\n--- Processing Stream ---")
+        from stream_processor import process_stream
+        count = process_stream(args.stream, stream_output, stride=args.stride,
+                               frame_diff=args.frame_diff, camera=args.camera)
+        print(f"Processed {count} frames")
+
     # Generate dataset summary
     if args.summary or run_all:
         print("\n--- Generating Dataset Summary ---")
+        from visualizer import visualize_dataset_summary
         try:
             visualize_dataset_summary()
         except FileNotFoundError:
@@ -0,0 +1,149 @@
+import bisect
+import os
+import threading
+import time
+
+# Off unless TRAFFIC_METRICS is set (or enable() is called)
+ENABLED = os.environ.get('TRAFFIC_METRICS', '').lower() not in ('', '0', 'false', 'no')
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_lock = threading.Lock()
+_histograms = {}   # stage -> [bucket counts..., +Inf count], sum
+_counters = {}     # (name, sorted label items) -> value
+_local = threading.local()
+
+def enable(flag=True):
+    """Turns instrumentation on or off for this process."""
+    global ENABLED
+    ENABLED = flag
+
+def reset():
+    """Clears every collected metric."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+class _NullStage:
+    """Shared no-op context manager used while instrumentation is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+def stage(name):
+    """
+    Times a block of code as a named pipeline stage.
+
+    Usage:
+        with metrics.stage('imread'):
+            img = cv2.imread(path)
+
+    While instrumentation is disabled this returns a shared no-op object, so
+    the cost is a function call and a flag check.
+    """
+    if not ENABLED:
+        return _NULL_STAGE
+    return _Stage(name)
+
+def observe(name, seconds):
+    """Records one duration for a stage and adds it to the current request's breakdown."""
+    if not ENABLED:
+        return
+    index = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        entry = _histograms.get(name)
+        if entry is None:
+            entry = _histograms[name] = [[0] * (len(BUCKETS) + 1), 0.0]
+        entry[0][index] += 1
+        entry[1] += seconds
+
+    breakdown = getattr(_local, 'breakdown', None)
+    if breakdown is not None:
+        breakdown[name] = breakdown.get(name, 0.0) + seconds
+
+def increment(name, value=1, **labels):
+    """Adds value to a counter identified by name and labels."""
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def begin_request():
+    """Starts collecting a per-request stage breakdown on this thread."""
+    if ENABLED:
+        _local.breakdown = {}
+
+def end_request():
+    """
+    Stops collecting the breakdown on this thread.
+
+    Returns:
+        Dict of stage name to seconds spent during the request (empty if disabled)
+    """
+    breakdown = getattr(_local, 'breakdown', None)
+    _local.breakdown = None
+    return breakdown or {}
+
+def server_timing_header(breakdown, total=None):
+    """Formats a stage breakdown as a Server-Timing header value."""
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in breakdown.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(parts)
+
+def _format_labels(items):
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+def render_prometheus():
+    """Returns all metrics in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {name: (list(entry[0]), entry[1]) for name, entry in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = []
+    if histograms:
+        lines.append('# HELP traffic_stage_seconds Time spent in each pipeline stage')
+        lines.append('# TYPE traffic_stage_seconds histogram')
+        for name in sorted(histograms):
+            buckets, total = histograms[name]
+            cumulative = 0
+            for bound, count in zip(BUCKETS, buckets):
+                cumulative += count
+                lines.append(f'traffic_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            cumulative += buckets[-1]
+            lines.append(f'traffic_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {cumulative}')
+            lines.append(f'traffic_stage_seconds_sum{{stage="{name}"}} {total}')
+            lines.append(f'traffic_stage_seconds_count{{stage="{name}"}} {cumulative}')
+
+    for name in sorted({key[0] for key in counters}):
+        lines.append(f'# TYPE traffic_{name}_total counter')
+        # Label values may be of mixed types, so sort on their repr
+        for (counter_name, labels), value in sorted(counters.items(),
+                                                    key=lambda kv: (kv[0][0], repr(kv[0][1]))):
+            if counter_name == name:
+                lines.append(f'traffic_{name}_total{_format_labels(labels)} {value}')
+
+    return '\n'.join(lines) + '\n'
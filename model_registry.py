@@ -0,0 +1,131 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import metrics
+
+
+def _load_pickle(data):
+    return pickle.loads(data)
+
+
+def write_atomic(path, data):
+    """
+    Writes bytes to path so that readers only ever see the old or the new file.
+
+    The data is written to a temporary file in the same directory, flushed to
+    disk and then moved over the destination with os.replace().
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of model files that are loaded once and served from memory.
+
+    Every lookup compares the file's stat signature (mtime, size, inode) with the
+    loaded copy. When it changes the file is read and hashed; the new object is
+    only swapped in after it has been fully loaded, and only if the content hash
+    differs. If a reload fails the previously loaded object keeps being served,
+    and the failed file is remembered so it is not retried until it changes again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    @staticmethod
+    def _current(entry, signature):
+        """True if entry already reflects the file with this signature (loaded or failed)."""
+        if entry is None:
+            return False
+        return entry['signature'] == signature or entry.get('failed', (None,))[0] == signature
+
+    @staticmethod
+    def _signature(path):
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def get(self, path, loader=_load_pickle):
+        """
+        Returns the object stored at path, reloading it if the file has changed.
+
+        Args:
+            path: Path to the model file
+            loader: Callable turning the file's bytes into the served object
+
+        Returns:
+            The loaded object
+        """
+        signature = self._signature(path)
+        entry = self._entries.get(path)
+        if self._current(entry, signature):
+            return entry['model']
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if self._current(entry, signature):
+                return entry['model']
+
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+
+            if entry is not None and entry['digest'] == digest:
+                # Touched but not modified
+                entry = {'signature': signature, 'digest': digest, 'model': entry['model']}
+            elif entry is not None and entry.get('failed', (None, None))[1] == digest:
+                # Same content that already failed to load
+                entry['failed'] = (signature, digest)
+                return entry['model']
+            else:
+                try:
+                    with metrics.stage('model_load'):
+                        model = loader(data)
+                    metrics.increment('model_loads')
+                except Exception:
+                    if entry is None:
+                        raise
+                    print(f"Warning: Failed to reload {path}, keeping previous version")
+                    entry['failed'] = (signature, digest)
+                    return entry['model']
+                entry = {'signature': signature, 'digest': digest, 'model': model}
+
+            self._entries[path] = entry
+            return entry['model']
+
+    def version(self, path):
+        """Returns the content hash of the currently loaded copy of path, or None."""
+        entry = self._entries.get(path)
+        return entry['digest'] if entry is not None else None
+
+    def clear(self):
+        """Drops every cached object."""
+        with self._lock:
+            self._entries.clear()
+
+
+_registry = ModelRegistry()
+
+
+def get_model(model_path):
+    """Returns the pickled model at model_path from the process-wide registry."""
+    return _registry.get(model_path)
+
+
+def get_registry():
+    """Returns the process-wide model registry."""
+    return _registry
@@ -1,47 +1,292 @@
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing
 import numpy as np
 import os
 import pickle
+import time
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
 from sklearn.metrics import classification_report, accuracy_score
+from threadpoolctl import threadpool_limits
+from feature_extractor import LABELS, load_features, open_feature_arrays
+from model_registry import write_atomic
 
-def train_traffic_model():
+# Extra counts per lane covered by the lookup table beyond the largest seen in training
+LUT_MARGIN = 5
+# Largest table compiled (one byte per entry); bigger count ranges keep using the forest
+MAX_LUT_ENTRIES = 1 << 24
+# Rows per model.predict call while filling the table
+LUT_CHUNK = 1 << 18
+
+# Training sets with more rows than this are read from disk one chunk at a time
+CHUNK_ROWS = 1_000_000
+# Held-out rows scored after training (sampled when the test split is larger)
+EVAL_ROWS = 200_000
+# Rows sampled from the training split for the hyperparameter search
+SEARCH_ROWS = 200_000
+
+DEFAULT_MODEL = ('random_forest', {'n_estimators': 100})
+
+# Candidates tried by search_models(), in order of preference on ties
+SEARCH_SPACE = [
+    DEFAULT_MODEL,
+    ('random_forest', {'n_estimators': 200, 'max_depth': 12}),
+    ('random_forest', {'n_estimators': 100, 'min_samples_leaf': 5}),
+    ('hist_gradient_boosting', {'max_iter': 100, 'learning_rate': 0.1}),
+    ('hist_gradient_boosting', {'max_iter': 300, 'learning_rate': 0.05}),
+    ('hist_gradient_boosting', {'max_iter': 200, 'max_leaf_nodes': 15}),
+]
+
+def compile_lookup_table(model, X, lut_path, margin=LUT_MARGIN):
+    """
+    Compiles a trained classifier into a dense lookup table over lane counts.
+
+    The model is evaluated once for every combination of per-lane counts from 0
+    up to the largest count seen in X plus margin. The result is a uint8 array
+    indexed as table[c1, c2, c3, c4] holding the index of the predicted label.
+    The table is saved as a plain .npy file (so it can be memory-mapped) next to
+    a JSON sidecar with the labels and the table's sha256; the sidecar is
+    written first so readers never pair a new table with old labels.
+
+    Args:
+        model: Fitted classifier with predict() and classes_
+        X: (N, lanes) training count matrix, used to size the table
+        lut_path: Destination .npy path; the sidecar uses the same name with .json
+        margin: Extra counts per lane covered beyond the observed maximum
+
+    Returns:
+        The table, or None if the count range is too large to compile
+    """
+    meta_path = os.path.splitext(lut_path)[0] + '.json'
+    shape = tuple(int(m) + margin + 1 for m in np.asarray(X).max(axis=0))
+    size = int(np.prod(shape))
+
+    if size > MAX_LUT_ENTRIES or len(model.classes_) > 256:
+        # Never leave a table from an older model behind
+        for path in (lut_path, meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+        print(f"Warning: Lookup table of {size} entries exceeds the limit, serving the forest directly")
+        return None
+
+    labels = list(model.classes_)
+    table = np.empty(size, dtype=np.uint8)
+    for start in range(0, size, LUT_CHUNK):
+        stop = min(start + LUT_CHUNK, size)
+        grid = np.stack(np.unravel_index(np.arange(start, stop), shape), axis=1)
+        table[start:stop] = np.searchsorted(model.classes_, model.predict(grid))
+    table = table.reshape(shape)
+
+    buffer = io.BytesIO()
+    np.save(buffer, table)
+    data = buffer.getvalue()
+    meta = {
+        'labels': [str(label) for label in labels],
+        'shape': list(shape),
+        'sha256': hashlib.sha256(data).hexdigest(),
+    }
+    write_atomic(meta_path, json.dumps(meta).encode())
+    write_atomic(lut_path, data)
+    print(f"Lookup table {shape} saved to '{lut_path}'")
+    return table
+
+def make_model(family, params, n_jobs=None):
+    """
+    Builds an unfitted classifier.
+
+    Args:
+        family: 'random_forest' or 'hist_gradient_boosting'
+        params: Keyword arguments for the estimator
+        n_jobs: Cores used by random forests (-1 = all)
+
+    Returns:
+        The estimator
+    """
+    if family == 'random_forest':
+        return RandomForestClassifier(random_state=42, n_jobs=n_jobs, **params)
+    if family == 'hist_gradient_boosting':
+        return HistGradientBoostingClassifier(random_state=42, **params)
+    raise ValueError(f"Unknown model family: {family}")
+
+def _evaluate_candidate(family, params, X_fit, y_fit, X_val, y_val):
+    """Fits one search candidate on a single core and returns its validation accuracy."""
+    start = time.perf_counter()
+    with threadpool_limits(1):
+        model = make_model(family, params, n_jobs=1)
+        model.fit(X_fit, y_fit)
+        accuracy = accuracy_score(y_val, model.predict(X_val))
+    return family, params, accuracy, time.perf_counter() - start
+
+def search_models(X, y, time_budget=300, workers=None, candidates=SEARCH_SPACE):
+    """
+    Evaluates candidate models in parallel and picks the most accurate one.
+
+    Candidates are fitted in a pool of worker processes on a 75/25 split of
+    the given rows. When time_budget runs out, unfinished candidates are
+    terminated and the best finished one wins.
+
+    Args:
+        X: (N, num_lanes) count matrix
+        y: N label names
+        time_budget: Wall-clock seconds allowed for the search
+        workers: Worker processes (None = all cores)
+        candidates: List of (family, params) to try
+
+    Returns:
+        ((family, params), results) where results lists (family, params,
+        accuracy, seconds) for every finished candidate. Falls back to
+        DEFAULT_MODEL if nothing finished in time.
+    """
+    X_fit, X_val, y_fit, y_val = train_test_split(X, y, test_size=0.25, random_state=42)
+    deadline = time.monotonic() + time_budget
+    results = []
+
+    with multiprocessing.Pool(workers) as pool:
+        pending = [pool.apply_async(_evaluate_candidate, (family, params, X_fit, y_fit, X_val, y_val))
+                   for family, params in candidates]
+        while pending and time.monotonic() < deadline:
+            pending[0].wait(min(0.1, max(deadline - time.monotonic(), 0)))
+            waiting = []
+            for result in pending:
+                if not result.ready():
+                    waiting.append(result)
+                    continue
+                try:
+                    results.append(result.get())
+                    family, params, accuracy, seconds = results[-1]
+                    print(f"  {family} {params}: accuracy {accuracy:.4f} ({seconds:.1f}s)")
+                except Exception as e:
+                    print(f"Warning: Search candidate failed: {e}")
+            pending = waiting
+        if pending:
+            print(f"Warning: Time budget reached, skipped {len(pending)} unfinished candidates")
+        # Leaving the block terminates any candidate still running
+
+    if not results:
+        return DEFAULT_MODEL, results
+
+    order = {repr(candidate): i for i, candidate in enumerate(candidates)}
+    best = max(results, key=lambda r: (r[2], -order[repr((r[0], r[1]))]))
+    return (best[0], best[1]), results
+
+def _fit_forest_chunked(X, codes, labels, train_idx, params, n_jobs, chunk_rows):
+    """
+    Fits a random forest on memory-mapped data one chunk of rows at a time.
+
+    The training rows are split into stratified random chunks that each fit
+    an equal share of the trees (warm_start adds trees without refitting the
+    earlier ones), so only one chunk is ever held in memory. Stratifying keeps
+    every class in every chunk, which warm_start requires.
+    """
+    train_codes = np.asarray(codes[train_idx])
+    classes, class_sizes = np.unique(train_codes, return_counts=True)
+    n_estimators = params.get('n_estimators', 100)
+    n_chunks = min(-(-len(train_idx) // chunk_rows), int(class_sizes.min()), n_estimators)
+
+    rng = np.random.default_rng(42)
+    chunks = [[] for _ in range(n_chunks)]
+    for code in classes:
+        members = rng.permutation(train_idx[train_codes == code])
+        for chunk, part in zip(chunks, np.array_split(members, n_chunks)):
+            chunk.append(part)
+
+    model = make_model('random_forest', params, n_jobs=n_jobs)
+    model.set_params(warm_start=True)
+    trees = 0
+    for k, (chunk, share) in enumerate(zip(chunks, np.array_split(np.arange(n_estimators), n_chunks))):
+        rows = np.sort(np.concatenate(chunk))
+        trees += len(share)
+        model.set_params(n_estimators=trees)
+        model.fit(X[rows], labels[codes[rows]])
+        print(f"  Chunk {k + 1}/{n_chunks}: {len(rows)} rows, {trees} trees")
+    return model
+
+def train_traffic_model(n_jobs=-1, search=False, time_budget=300, chunk_rows=CHUNK_ROWS):
     """
     Trains a model to classify traffic density based on lane counts.
+
+    Features are memory-mapped from features_X.npy / features_y.npy when
+    present (falling back to features.npz), so training sets larger than
+    memory are only read in chunks.
+
+    Args:
+        n_jobs: Cores used to fit the forest (-1 = all)
+        search: Pick the model family and hyperparameters with search_models()
+            instead of using the default random forest
+        time_budget: Wall-clock seconds allowed for the search
+        chunk_rows: Training sets larger than this are fitted chunk by chunk.
+            Only the random forest can be fitted that way, so a searched
+            hist_gradient_boosting pick is replaced by DEFAULT_MODEL for them.
+
+    Returns:
+        The trained model, or None on failure
     """
     data_dir = 'data'
     features_path = os.path.join(data_dir, 'features.npz')
     model_path = os.path.join(data_dir, 'traffic_model.pkl')
+    lut_path = os.path.join(data_dir, 'traffic_model_lut.npy')
+
+    arrays = open_feature_arrays(data_dir)
 
     # Check if features file exists
-    if not os.path.exists(features_path):
+    if arrays is None and not os.path.exists(features_path):
         raise FileNotFoundError(f"Features file not found: {features_path}")
 
     try:
-        # Load features and labels
-        data = np.load(features_path, allow_pickle=True)
-        X = data['X']
-        y = data['y']
+        # Load features and labels; y is kept as label codes until rows are selected
+        if arrays is not None:
+            X, codes = arrays
+            labels = LABELS
+        else:
+            X, y = load_features(features_path)
+            labels, codes = np.unique(y, return_inverse=True)
 
         # Split data into training and testing sets
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        train_idx, test_idx = train_test_split(np.arange(len(X)), test_size=0.2, random_state=42)
+        rng = np.random.default_rng(42)
+
+        family, params = DEFAULT_MODEL
+        if search:
+            sample = train_idx
+            if len(sample) > SEARCH_ROWS:
+                sample = np.sort(rng.choice(train_idx, SEARCH_ROWS, replace=False))
+            print(f"Searching {len(SEARCH_SPACE)} candidates on {len(sample)} rows (budget {time_budget}s)")
+            (family, params), _ = search_models(X[sample], labels[codes[sample]], time_budget)
+            print(f"Selected {family} {params}")
+
+        # Gradient boosting has no incremental fit; fitting it would load the
+        # whole memory-mapped training set into RAM
+        if family != 'random_forest' and len(train_idx) > chunk_rows:
+            print(f"Warning: {family} can't be trained chunk by chunk on {len(train_idx)} rows, "
+                  f"using the chunked {DEFAULT_MODEL[0]} instead")
+            family, params = DEFAULT_MODEL
 
         # Initialize and train the model
-        model = RandomForestClassifier(n_estimators=100, random_state=42 )
-        model.fit(X_train, y_train)
+        if family == 'random_forest' and len(train_idx) > chunk_rows:
+            model = _fit_forest_chunked(X, codes, labels, train_idx, params, n_jobs, chunk_rows)
+        else:
+            model = make_model(family, params, n_jobs=n_jobs)
+            model.fit(X[train_idx], labels[codes[train_idx]])
 
         # Evaluate the model
-        y_pred = model.predict(X_test)
+        if len(test_idx) > EVAL_ROWS:
+            test_idx = np.sort(rng.choice(test_idx, EVAL_ROWS, replace=False))
+        y_test = labels[codes[test_idx]]
+        y_pred = model.predict(X[test_idx])
         accuracy = accuracy_score(y_test, y_pred)
         print(f"Model accuracy: {accuracy:.4f}")
         print(classification_report(y_test, y_pred))
 
-        # Save the model
-        os.makedirs(os.path.dirname(model_path), exist_ok=True)
-        with open(model_path, 'wb') as f:
-            pickle.dump(model, f)
+        # Save the model atomically so running servers never load a partial file
+        write_atomic(model_path, pickle.dumps(model))
         print(f"Model saved to '{model_path}'")
 
+        # Compile the model into a lookup table for serving
+        compile_lookup_table(model, X, lut_path)
+
         return model
 
     except Exception as e:
@@ -49,7 +294,17 @@ def train_traffic_model():
         return None
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Train the traffic density model')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Cores used to fit the forest (-1 = all)')
+    parser.add_argument('--search', action='store_true', help='Search model families and hyperparameters')
+    parser.add_argument('--time-budget', type=float, default=300, help='Seconds allowed for --search')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS,
+                        help='Fit chunk by chunk when the training set has more rows than this '
+                             '(random forest only; larger sets never use gradient boosting)')
+    args = parser.parse_args()
+
     try:
-        train_traffic_model()
+        train_traffic_model(n_jobs=args.n_jobs, search=args.search,
+                            time_budget=args.time_budget, chunk_rows=args.chunk_rows)
     except Exception as e:
         print(f"Error: {e}")
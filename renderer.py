@@ -0,0 +1,284 @@
+import cv2
+import hashlib
+import numpy as np
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from lane_geometry import LANE_WIDTH, vertical_strips
+from model_registry import write_atomic
+
+# Pending markers older than this (seconds) belong to a render that died
+STALE_PENDING = 60
+
+# BGR colours per congestion level (same palette as visualizer.py)
+CONGESTION_COLORS = {
+    'high': (60, 76, 231),
+    'med': (18, 156, 243),
+    'low': (113, 204, 46),
+}
+
+def _congestion_color(prediction):
+    key = str(prediction).lower()
+    if 'high' in key:
+        return CONGESTION_COLORS['high']
+    if 'med' in key:
+        return CONGESTION_COLORS['med']
+    return CONGESTION_COLORS['low']
+
+def render_traffic(img, lane_counts, prediction, lane_width=LANE_WIDTH, geometry=None):
+    """
+    Draws lane outlines, per-lane counts and the congestion label onto a copy of a frame.
+
+    This is the lightweight replacement for visualizer.visualize_traffic on the
+    serving path: it only uses OpenCV drawing primitives on the frame itself.
+
+    Args:
+        img: BGR traffic frame
+        lane_counts: List of vehicle counts per lane
+        prediction: Traffic density prediction
+        lane_width: Width of each lane in pixels (without a geometry)
+        geometry: LaneGeometry the counts were made with (defaults to vertical strips)
+
+    Returns:
+        Annotated BGR image
+    """
+    out = img.copy()
+    height, width = out.shape[:2]
+    color = _congestion_color(prediction)
+    if geometry is None:
+        geometry = vertical_strips(len(lane_counts), lane_width)
+    polygons = geometry.frame_polygons(out.shape)
+    bounds = geometry.lane_bounds(out.shape)
+
+    # Lane outlines, labelled at the top left of each lane
+    for lane, count in enumerate(lane_counts):
+        outline = polygons[lane].clip(0, [width - 1, height - 1])
+        cv2.polylines(out, [outline], True, color, 2)
+
+        x0, y0 = int(bounds[lane, 0]), int(bounds[lane, 1])
+        label = f"{geometry.names[lane]}: {count}"
+        cv2.rectangle(out, (x0 + 6, y0 + 8), (x0 + 6 + 11 * len(label), y0 + 34), (0, 0, 0), -1)
+        cv2.putText(out, label, (x0 + 10, y0 + 28), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                    (255, 255, 255), 1, cv2.LINE_AA)
+
+    # Congestion banner
+    banner = f"Prediction: {str(prediction).upper()}   Total: {sum(lane_counts)} vehicles"
+    cv2.rectangle(out, (0, height - 40), (width, height), color, -1)
+    cv2.putText(out, banner, (10, height - 13), cv2.FONT_HERSHEY_SIMPLEX, 0.7,
+                (255, 255, 255), 2, cv2.LINE_AA)
+    return out
+
+class LRUCache:
+    """Small thread-safe LRU mapping with a fixed number of entries."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+# Encoded renders keyed by (image content, counts, prediction, lane geometry)
+_render_cache = LRUCache(maxsize=256)
+
+def image_digest(img):
+    """Returns a content hash of a decoded image."""
+    h = hashlib.blake2b(np.ascontiguousarray(img).data, digest_size=16)
+    h.update(str(img.shape).encode())
+    return h.hexdigest()
+
+def render_traffic_png(img, lane_counts, prediction, digest=None, lane_width=LANE_WIDTH, geometry=None):
+    """
+    Returns the annotated frame as PNG bytes, served from an LRU cache when possible.
+
+    Args:
+        img: BGR traffic frame
+        lane_counts: List of vehicle counts per lane
+        prediction: Traffic density prediction
+        digest: Precomputed content hash of img (computed if omitted)
+        lane_width: Width of each lane in pixels (without a geometry)
+        geometry: LaneGeometry the counts were made with (defaults to vertical strips)
+
+    Returns:
+        PNG-encoded bytes
+    """
+    if digest is None:
+        digest = image_digest(img)
+    if geometry is None:
+        geometry = vertical_strips(len(lane_counts), lane_width)
+    key = (digest, tuple(int(c) for c in lane_counts), str(prediction), geometry.digest)
+
+    png = _render_cache.get(key)
+    if png is not None:
+        metrics.increment('render_cache', result='hit')
+        return png
+    metrics.increment('render_cache', result='miss')
+
+    with metrics.stage('render'):
+        annotated = render_traffic(img, lane_counts, prediction, geometry=geometry)
+    with metrics.stage('png_encode'):
+        ok, buffer = cv2.imencode('.png', annotated, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    if not ok:
+        raise Exception("Failed to encode visualization")
+
+    png = buffer.tobytes()
+    _render_cache.put(key, png)
+    return png
+
+class VisualizationQueue:
+    """
+    Renders visualizations on a bounded background thread pool.
+
+    submit() returns an ID straight away; result() reports whether the PNG for
+    that ID is ready. Identical requests (same image, counts, prediction and
+    lane geometry) share one ID and one render. At most max_pending renders are
+    queued at a time, and only the most recent max_results finished renders
+    are kept.
+
+    With store_dir set, finished PNGs are also written to that directory (and
+    a marker file is kept while a render is in progress), so processes that
+    share the directory can answer result() for each other's renders. Files
+    older than store_ttl seconds are pruned as new renders finish.
+    """
+
+    def __init__(self, max_workers=2, max_pending=32, max_results=256, store_dir=None, store_ttl=3600):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='render')
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_results = max_results
+        self.store_dir = store_dir
+        self.store_ttl = store_ttl
+        self._last_prune = 0.0
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+
+    def _store_path(self, viz_id, suffix):
+        return os.path.join(self.store_dir, viz_id + suffix)
+
+    def _render(self, viz_id, img, counts, prediction, digest, geometry):
+        """Renders one PNG and, with a store, publishes it for other processes."""
+        try:
+            png = render_traffic_png(img, counts, prediction, digest, geometry=geometry)
+            if self.store_dir:
+                write_atomic(self._store_path(viz_id, '.png'), png)
+            return png
+        finally:
+            if self.store_dir:
+                try:
+                    os.remove(self._store_path(viz_id, '.pending'))
+                except FileNotFoundError:
+                    pass
+                self._prune()
+
+    def _prune(self):
+        """Deletes stored files older than store_ttl, at most once a minute."""
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        with os.scandir(self.store_dir) as entries:
+            for entry in entries:
+                try:
+                    if now - entry.stat().st_mtime > self.store_ttl:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    @staticmethod
+    def visualization_id(digest, lane_counts, prediction, geometry=None):
+        """Returns the ID submit() assigns to a render of this image and analysis."""
+        counts = [int(c) for c in lane_counts]
+        lanes = geometry.digest if geometry is not None else None
+        return hashlib.blake2b(repr((digest, counts, str(prediction), lanes)).encode(),
+                               digest_size=12).hexdigest()
+
+    def submit(self, img, lane_counts, prediction, digest=None, geometry=None):
+        """
+        Queues a render.
+
+        Returns:
+            The visualization ID, or None if the queue is full
+        """
+        if digest is None:
+            digest = image_digest(img)
+        counts = [int(c) for c in lane_counts]
+        viz_id = self.visualization_id(digest, counts, prediction, geometry)
+
+        with self._lock:
+            if viz_id in self._jobs:
+                self._jobs.move_to_end(viz_id)
+                return viz_id
+
+            if self.store_dir and os.path.exists(self._store_path(viz_id, '.png')):
+                return viz_id
+
+            if not self._pending.acquire(blocking=False):
+                return None
+
+            if self.store_dir:
+                open(self._store_path(viz_id, '.pending'), 'wb').close()
+            future = self._executor.submit(self._render, viz_id, img, counts, prediction, digest, geometry)
+            future.add_done_callback(lambda _: self._pending.release())
+            self._jobs[viz_id] = future
+            while len(self._jobs) > self.max_results:
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if not oldest.done():
+                    break
+                del self._jobs[oldest_id]
+        return viz_id
+
+    def _stored_result(self, viz_id):
+        """Looks up a render made by any process sharing store_dir."""
+        # IDs are hex digests; anything else can't name a stored file
+        if not viz_id or any(c not in '0123456789abcdef' for c in viz_id):
+            return 'missing', None
+        try:
+            with open(self._store_path(viz_id, '.png'), 'rb') as f:
+                return 'ready', f.read()
+        except FileNotFoundError:
+            pass
+        try:
+            if time.time() - os.path.getmtime(self._store_path(viz_id, '.pending')) < STALE_PENDING:
+                return 'pending', None
+        except FileNotFoundError:
+            pass
+        return 'missing', None
+
+    def result(self, viz_id):
+        """
+        Looks up a visualization.
+
+        Returns:
+            ('missing', None), ('pending', None), ('failed', error) or ('ready', png_bytes)
+        """
+        with self._lock:
+            future = self._jobs.get(viz_id)
+        if future is None:
+            if self.store_dir:
+                return self._stored_result(viz_id)
+            return 'missing', None
+        if not future.done():
+            return 'pending', None
+        error = future.exception()
+        if error is not None:
+            return 'failed', error
+        return 'ready', future.result()
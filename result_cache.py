@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import metrics
+from renderer import LRUCache
+
+DEFAULT_CACHE_PATH = os.path.join('output', 'results.sqlite')
+
+# Rows kept in the SQLite tier; the oldest are pruned beyond this
+MAX_ROWS = 1_000_000
+# Puts between checks of the row limit
+PRUNE_EVERY = 1000
+
+def content_hash(data):
+    """Returns the content hash of encoded image bytes used as the cache key."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+class ResultCache:
+    """
+    Two-tier cache of analysis results keyed by image content hash and model
+    version.
+
+    Lookups try an in-memory LRU first and then a SQLite table, which survives
+    restarts and is shared by every process using the same file (WAL mode lets
+    readers and a writer work concurrently). Results from other model versions
+    never match because the version is part of the key; the first write under
+    a new version deletes the old rows. The cache is best effort: database
+    errors are reported and treated as misses.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, memory_size=4096, max_rows=MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self._memory = LRUCache(maxsize=memory_size)
+        self._local = threading.local()
+        self._puts = 0
+        self._version = None
+
+    def _connection(self):
+        """Returns this thread's connection, opening it on first use (also after a fork)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS results ('
+                     'digest TEXT NOT NULL, version TEXT NOT NULL, result TEXT NOT NULL, '
+                     'created REAL NOT NULL, PRIMARY KEY (digest, version))')
+        conn.execute('CREATE INDEX IF NOT EXISTS results_created ON results (created)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, digest, version):
+        """
+        Looks up a cached result.
+
+        Args:
+            digest: content_hash() of the encoded image
+            version: Model version string the result must have been produced with
+
+        Returns:
+            The cached result dict, or None
+        """
+        key = (digest, version)
+        result = self._memory.get(key)
+        if result is not None:
+            metrics.increment('result_cache', tier='memory', result='hit')
+            return result
+
+        try:
+            with metrics.stage('result_cache_sqlite'):
+                row = self._connection().execute(
+                    'SELECT result FROM results WHERE digest = ? AND version = ?', key).fetchone()
+        except sqlite3.Error as e:
+            print(f"Warning: Result cache lookup failed: {e}")
+            row = None
+
+        if row is None:
+            metrics.increment('result_cache', tier='sqlite', result='miss')
+            return None
+
+        metrics.increment('result_cache', tier='sqlite', result='hit')
+        result = json.loads(row[0])
+        self._memory.put(key, result)
+        return result
+
+    def put(self, digest, version, result):
+        """
+        Stores a JSON-serializable result in both tiers.
+
+        Args:
+            digest: content_hash() of the encoded image
+            version: Model version string the result was produced with
+            result: Dict to cache
+        """
+        self._memory.put((digest, version), result)
+        try:
+            conn = self._connection()
+            if version != self._version:
+                # Results from any other model version can never be served again
+                conn.execute('DELETE FROM results WHERE version != ?', (version,))
+                self._version = version
+            conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                         (digest, version, json.dumps(result), time.time()))
+
+            self._puts += 1
+            if self._puts % PRUNE_EVERY == 0:
+                conn.execute('DELETE FROM results WHERE rowid IN (SELECT rowid FROM results '
+                             'ORDER BY created DESC LIMIT -1 OFFSET ?)', (self.max_rows,))
+        except sqlite3.Error as e:
+            print(f"Warning: Result cache write failed: {e}")
+
+    def clear(self):
+        """Drops every cached result from both tiers."""
+        self._memory = LRUCache(maxsize=self._memory.maxsize)
+        try:
+            self._connection().execute('DELETE FROM results')
+        except sqlite3.Error as e:
+            print(f"Warning: Result cache clear failed: {e}")
@@ -0,0 +1,236 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+# Model files watched for changes; a change triggers a rolling reload
+WATCHED_FILES = ('traffic_model.pkl', 'traffic_model_lut.npy')
+
+# Seconds a worker gets to finish in-flight requests before it is killed
+GRACEFUL_TIMEOUT = 30
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except FileNotFoundError:
+        return None
+
+class PreforkServer:
+    """
+    Serves the Flask app from several forked worker processes sharing one
+    listening socket.
+
+    The parent imports the app, loads the model and other read-only state, and
+    then calls gc.freeze() so those objects are left out of later garbage
+    collections; forked workers therefore share their memory pages
+    copy-on-write instead of each holding a private copy. Every worker runs a
+    threaded WSGI server on the inherited socket and the kernel spreads
+    connections between them, so CPU-bound detection runs on several cores.
+
+    The parent restarts workers that exit unexpectedly. On SIGHUP, or when a
+    watched model file changes, it reloads the model and replaces the workers
+    one at a time, so some workers are always accepting requests. SIGTERM or
+    SIGINT stops every worker gracefully, letting in-flight requests finish.
+    """
+
+    def __init__(self, sock, workers, data_dir='data', watch_interval=2.0):
+        self.sock = sock
+        self.num_workers = workers
+        self.data_dir = data_dir
+        self.watch_interval = watch_interval
+        self.workers = {}           # pid -> slot
+        self._reload_requested = False
+        self._stop_requested = False
+        self._signatures = {}
+
+    def _watched_signatures(self):
+        return {name: _file_signature(os.path.join(self.data_dir, name)) for name in WATCHED_FILES}
+
+    def preload(self):
+        """Loads the app and model in the parent so workers inherit them."""
+        # Unfreeze objects from an earlier preload so a reload can collect them
+        gc.unfreeze()
+        from traffic_predictor import load_lookup_table, load_model
+        import server
+
+        self._signatures = self._watched_signatures()
+        if load_lookup_table(self.data_dir) is None:
+            try:
+                load_model(self.data_dir)
+            except Exception as e:
+                print(f"Warning: No model loaded, workers will retry on first request: {e}")
+        server.image_index.refresh()
+
+        gc.collect()
+        gc.freeze()
+        return server.app
+
+    def _worker(self, app, slot):
+        """Body of a forked worker process; never returns."""
+        import cv2
+        from werkzeug.serving import make_server
+
+        # The parent coordinates shutdown and reloads (a HUP to the whole process group
+        # must not kill workers); one OpenCV thread per worker avoids oversubscription
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        cv2.setNumThreads(1)
+
+        host, port = self.sock.getsockname()[:2]
+        server = make_server(host, port, app, threaded=True, fd=self.sock.fileno())
+        # Wait for in-flight requests when shutting down
+        server.daemon_threads = False
+        server.block_on_close = True
+
+        def stop(signum, frame):
+            threading.Thread(target=server.shutdown, daemon=True).start()
+        signal.signal(signal.SIGTERM, stop)
+
+        if slot == 0:
+            import server as api
+            api.thumbnails.warm_up_async(api.image_index.names()[:api.WARM_UP_IMAGES])
+
+        code = 0
+        try:
+            server.serve_forever()
+        except Exception as e:
+            print(f"Worker {os.getpid()} failed: {e}", file=sys.stderr)
+            code = 1
+        finally:
+            server.server_close()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def spawn(self, app, slot):
+        """Forks one worker for slot."""
+        pid = os.fork()
+        if pid == 0:
+            self._worker(app, slot)
+        self.workers[pid] = slot
+        print(f"Started worker {pid} (slot {slot})")
+        return pid
+
+    def stop_worker(self, pid, timeout=GRACEFUL_TIMEOUT):
+        """Asks a worker to finish its requests and exit, killing it after timeout."""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if done:
+                break
+            time.sleep(0.05)
+        else:
+            print(f"Worker {pid} did not stop in {timeout}s, killing it")
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.pop(pid, None)
+
+    def reload(self):
+        """Reloads the model in the parent and replaces workers one at a time."""
+        print("Reloading workers")
+        app = self.preload()
+        for pid, slot in list(self.workers.items()):
+            self.spawn(app, slot)
+            self.stop_worker(pid)
+        return app
+
+    def _reap(self):
+        """Collects exited workers and returns the slots they held."""
+        freed = []
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            slot = self.workers.pop(pid, None)
+            if slot is not None:
+                print(f"Worker {pid} exited with status {status}")
+                freed.append(slot)
+        return freed
+
+    def run(self):
+        """Starts the workers and supervises them until SIGTERM or SIGINT."""
+        def request_stop(signum, frame):
+            self._stop_requested = True
+
+        def request_reload(signum, frame):
+            self._reload_requested = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGHUP, request_reload)
+
+        app = self.preload()
+        for slot in range(self.num_workers):
+            self.spawn(app, slot)
+
+        next_check = time.monotonic() + self.watch_interval
+        while not self._stop_requested:
+            time.sleep(0.2)
+
+            for slot in self._reap():
+                if not self._stop_requested:
+                    time.sleep(0.5)   # Avoid a tight loop if workers crash on start
+                    self.spawn(app, slot)
+
+            if not self._reload_requested and self.watch_interval and time.monotonic() >= next_check:
+                next_check = time.monotonic() + self.watch_interval
+                if self._watched_signatures() != self._signatures:
+                    print("Model files changed")
+                    self._reload_requested = True
+
+            if self._reload_requested and not self._stop_requested:
+                self._reload_requested = False
+                app = self.reload()
+
+        print("Shutting down")
+        for pid in list(self.workers):
+            os.kill(pid, signal.SIGTERM)
+        for pid in list(self.workers):
+            self.stop_worker(pid)
+        self.sock.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the traffic analysis API with pre-forked workers')
+    parser.add_argument('--host', type=str, default='0.0.0.0', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=5000, help='Port to listen on')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    parser.add_argument('--backlog', type=int, default=1024, help='Listen queue length')
+    parser.add_argument('--watch-interval', type=float, default=2.0,
+                        help='Seconds between model file checks (0 disables automatic reload)')
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        print("Error: serve.py needs os.fork(); use 'python server.py' on this platform")
+        sys.exit(1)
+
+    for directory in ['data', 'output']:
+        os.makedirs(directory, exist_ok=True)
+
+    # Renders must be visible to whichever worker handles the follow-up request
+    import server
+    from renderer import VisualizationQueue
+    server.visualizations = VisualizationQueue(max_workers=2, max_pending=32,
+                                               store_dir=os.path.join('output', 'visualizations'))
+
+    sock = socket.create_server((args.host, args.port), backlog=args.backlog)
+    sock.set_inheritable(True)
+    print(f"Listening on http://{args.host}:{args.port} with {args.workers} workers")
+    PreforkServer(sock, max(1, args.workers), watch_interval=args.watch_interval).run()
+
+if __name__ == '__main__':
+    main()
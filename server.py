@@ -1,17 +1,86 @@
-from flask import Flask, jsonify, render_template, request, send_from_directory
+from flask import Flask, Response, g, jsonify, render_template, request, send_file, send_from_directory
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import FormDataParser
+from PIL import Image
+import io
 import os
-import base64
-from io import BytesIO
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+import time
+import warnings
+import metrics
 
 # Import existing functions
-from traffic_predictor import predict_traffic
-from visualizer import visualize_traffic
+from traffic_predictor import decode_image, model_version, predict_image, predict_traffic_batch
+from renderer import VisualizationQueue
+from image_index import ImageIndex, DEFAULT_PAGE_SIZE
+from thumbnails import ThumbnailCache
+from result_cache import ResultCache, content_hash
+from history_store import HistoryStore
+from lane_geometry import DEFAULT_CAMERA, get_geometry
+from signal_timing import calculate_traffic_light_timings_per_lane, calculate_traffic_light_timings_bulk
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 
+# Upper bound on images accepted by /api/analyze/batch
+MAX_BATCH_SIZE = 1000
+
+# Upper bound on intersections accepted by /api/timings/bulk
+MAX_BULK_INTERSECTIONS = 100000
+
+# Largest encoded image read by /api/analyze or accepted by /api/analyze/upload
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+# Largest decoded image accepted by /api/analyze/upload
+MAX_UPLOAD_PIXELS = 4096 * 4096
+# Frame sizes are checked against MAX_UPLOAD_PIXELS from the image header
+# before decoding, so Pillow's own decompression-bomb warning is redundant
+warnings.filterwarnings('ignore', category=Image.DecompressionBombWarning)
+# Room for multipart boundaries and part headers on top of MAX_UPLOAD_BYTES
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Background renderer for /api/analyze visualizations
+visualizations = VisualizationQueue(max_workers=2, max_pending=32)
+
+# Sorted listing of data/, refreshed when the directory changes
+image_index = ImageIndex('data')
+
+# Analysis results keyed by image content, lane geometry and model version
+results = ResultCache()
+
+# Log of every analysis with hourly rollups for trend queries
+history = HistoryStore()
+
+# On-disk JPEG thumbnails for the image grid
+thumbnails = ThumbnailCache('data')
+
+# Seconds browsers may reuse a frame or thumbnail before revalidating it
+IMAGE_MAX_AGE = 300
+
+# Thumbnails generated in the background when the server starts
+WARM_UP_IMAGES = 1000
+
+@app.before_request
+def start_request_timing():
+    """Start collecting the per-stage breakdown for this request"""
+    g.start_time = time.perf_counter()
+    metrics.begin_request()
+
+@app.after_request
+def add_server_timing(response):
+    """Expose the stage breakdown as a Server-Timing header"""
+    breakdown = metrics.end_request()
+    if metrics.ENABLED:
+        total = time.perf_counter() - g.start_time
+        # Requests that matched no route (e.g. /favicon.ico) have no endpoint
+        endpoint = request.endpoint or 'unmatched'
+        metrics.observe(f'request:{endpoint}', total)
+        metrics.increment('http_requests', endpoint=endpoint, status=response.status_code)
+        response.headers['Server-Timing'] = metrics.server_timing_header(breakdown, total)
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text exposition of stage histograms and counters"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     """Serve the main page"""
@@ -19,14 +88,26 @@ def index():
 
 @app.route('/api/images')
 def get_images():
-    """Get list of available traffic images"""
-    # Only use existing images from the data directory
-    image_dir = 'data'
-    images = []
-    if os.path.exists(image_dir):
-        images = [f for f in os.listdir(image_dir)
-                  if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-    return jsonify({'images': images})
+    """
+    Get a page of available traffic images
+
+    Query parameters: cursor, limit, order ('name' or 'mtime'), desc,
+    prefix, since and until (Unix seconds).
+    """
+    args = request.args
+    try:
+        page = image_index.query(
+            cursor=args.get('cursor'),
+            limit=args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            order=args.get('order', 'name'),
+            descending=args.get('desc', '').lower() in ('1', 'true', 'yes'),
+            prefix=args.get('prefix') or None,
+            since=args.get('since', type=float),
+            until=args.get('until', type=float),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page)
 
 @app.route('/api/analyze', methods=['POST'])
 def analyze_image():
@@ -40,110 +121,295 @@ def analyze_image():
     if not image_path:
         return jsonify({'error': 'Image path is required'}), 400
 
-    if not os.path.exists(image_path):
+    # Only regular files; devices such as /dev/zero never end
+    if not os.path.isfile(image_path):
         return jsonify({'error': f'Image not found: {image_path}'}), 404
 
+    too_large = {'error': f'Image exceeds {MAX_UPLOAD_BYTES} bytes'}
+    try:
+        if os.path.getsize(image_path) > MAX_UPLOAD_BYTES:
+            return jsonify(too_large), 413
+        with metrics.stage('read_file'):
+            with open(image_path, 'rb') as f:
+                encoded = f.read(MAX_UPLOAD_BYTES + 1)
+    except OSError as e:
+        return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
+    # The file may have grown since it was checked
+    if len(encoded) > MAX_UPLOAD_BYTES:
+        return jsonify(too_large), 413
+
+    return _analyze(encoded, camera=data.get('camera'), timestamp=data.get('timestamp'))
+
+def _analyze(encoded, max_pixels=None, camera=None, timestamp=None):
+    """
+    Analyze encoded image bytes and build the response
+
+    Lanes are counted with the camera's lane geometry. Results are cached by
+    content hash, lane geometry and model version, so a repeat of the same
+    frame costs a hash and a lookup; the frame is only decoded when the
+    analysis or its visualization has to be produced. Every analysis, cached
+    or not, is recorded in the history store under the request's camera.
+    """
+    camera = camera or request.headers.get('X-Camera-Id') or DEFAULT_CAMERA
+    try:
+        timestamp = None if timestamp is None else float(timestamp)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'timestamp must be Unix seconds'}), 400
+
+    # Reject oversized frames from their header, before either decode below
+    # (analysis or visualization) allocates the full image
+    if max_pixels:
+        try:
+            if _exceeds_pixels(encoded, max_pixels):
+                return jsonify({'error': f'Image exceeds {max_pixels} pixels'}), 413
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    digest = content_hash(encoded)
+    img = None
     try:
-        # Use the existing predict_traffic function
-        prediction, counts, img_path = predict_traffic(image_path)
+        geometry = get_geometry(camera)
+        key = f"{digest}:{geometry.digest}"
+        version = model_version('data')
+        cached = results.get(key, version)
+        if cached is None:
+            img = decode_image(encoded)
+            prediction, counts = predict_image(img, geometry)
 
-        # Calculate traffic light timings based on analysis
-        timings = calculate_traffic_light_timings_per_lane(counts, prediction)
+            # Calculate traffic light timings based on analysis
+            timings = calculate_traffic_light_timings_per_lane(counts, prediction)
+            cached = {'prediction': str(prediction), 'counts': counts, 'timings': timings}
+            results.put(key, version, cached)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
 
-    # Create visualization and convert to base64 for sending to frontend
+    prediction, counts = cached['prediction'], cached['counts']
+
     try:
-        img_buffer = BytesIO()
-        plt.figure(figsize=(10, 6))
-        visualize_traffic(img_path, counts, prediction)
-        plt.savefig(img_buffer, format='png')
-        plt.close()
-        img_buffer.seek(0)
-        img_base64 = base64.b64encode(img_buffer.read()).decode('utf-8')
+        with metrics.stage('history'):
+            history.record(camera, counts, prediction, cached['timings'], timestamp)
     except Exception as e:
-        print(f"Visualization error: {e}")
-        img_base64 = None
+        print(f"Warning: Failed to record analysis history: {e}")
+
+    # Render the visualization in the background; the client fetches it
+    # from /api/visualization/<id> once it is ready. A cached analysis reuses
+    # an existing render and only decodes the frame if that render is gone.
+    viz_id = visualizations.visualization_id(digest, counts, prediction, geometry)
+    if visualizations.result(viz_id)[0] == 'missing':
+        try:
+            if img is None:
+                img = decode_image(encoded)
+            viz_id = visualizations.submit(img, counts, prediction, digest, geometry)
+        except ValueError:
+            viz_id = None
 
     # Prepare and return response
     response = {
         'prediction': prediction,
         'counts': counts,
-        'timings': timings,
-        'visualization': img_base64
+        'timings': cached['timings'],
+        'visualization_id': viz_id,
+        'visualization_url': f'/api/visualization/{viz_id}' if viz_id else None
     }
 
     return jsonify(response)
 
-@app.route('/data/<filename>')
-def serve_image(filename):
-    """Serve traffic images from the data directory"""
-    return send_from_directory('data', filename)
+def _exceeds_pixels(encoded, max_pixels):
+    """
+    Check an encoded image's size against max_pixels from its header alone
 
-def calculate_traffic_light_timings_per_lane(counts, prediction):
+    Raises:
+        ValueError: If the bytes are not a recognized image
     """
-    Calculate dynamic traffic light timings for each of four lanes.
-
-    Args:
-        counts (list of int): vehicle counts for lanes 1–4, e.g. [c1, c2, c3, c4].
-        prediction (str): one of "High Congestion", "Medium Congestion", or "Low Congestion".
-
-    Returns:
-        dict: {
-            0: {'green': G1, 'yellow': Y, 'red': R1},
-            1: {'green': G2, 'yellow': Y, 'red': R2},
-            2: {'green': G3, 'yellow': Y, 'red': R3},
-            3: {'green': G4, 'yellow': Y, 'red': R4},
-            'cycle_length': C
-        }
+    try:
+        with Image.open(io.BytesIO(encoded)) as header:
+            width, height = header.size
+    except Image.DecompressionBombError:
+        # Pillow refuses sizes far beyond any limit used here
+        return True
+    except OSError:
+        raise ValueError("Could not decode image data")
+    return width * height > max_pixels
+
+def _memory_stream(total_content_length, content_type, filename, content_length=None):
+    return io.BytesIO()
+
+class InMemoryFormDataParser(FormDataParser):
+    """Form parser that keeps uploaded files in memory instead of spooling large ones to disk"""
+
+    def __init__(self, stream_factory=None, *args, **kwargs):
+        super().__init__(_memory_stream, *args, **kwargs)
+
+@app.route('/api/analyze/upload', methods=['POST'])
+def analyze_upload():
     """
-    # Ensure we have exactly 4 lanes
-    if not counts or len(counts) != 4:
-        raise ValueError("counts must be a list of 4 non-negative integers")
-
-    total_vehicles = sum(counts)
-    # Base cycle parameters
-    base_green = 30     # nominal total green-time budget (sec) to split among lanes
-    base_yellow = 5     # fixed per-lane yellow
-    base_red = 30       # nominal red (will be adjusted per lane)
-    min_green = 10      # per-lane minimum green
-    max_green = 60      # per-lane maximum green
-
-    # Congestion multiplier
-    if prediction == "High Congestion":
-        cong_mul = 1.5
-    elif prediction == "Medium Congestion":
-        cong_mul = 1.2
-    else:  # Low Congestion
-        cong_mul = 1.0
-
-    # Adjust the total green budget by congestion
-    green_budget = int(base_green * cong_mul)
-    # Distribute green_budget proportionally, or equally if no vehicles
-    if int(total_vehicles) > 0:
-        ratios = [c / total_vehicles for c in counts]
+    Analyze an uploaded traffic image without writing it to disk
+
+    Accepts the encoded image either as the raw request body or as the
+    'image' field of a multipart/form-data upload.
+    """
+    too_large = {'error': f'Image exceeds {MAX_UPLOAD_BYTES} bytes'}
+    # Also enforced while reading, for bodies sent without a Content-Length
+    request.max_content_length = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD
+    if request.content_length is not None and request.content_length > request.max_content_length:
+        return jsonify(too_large), 413
+
+    if request.mimetype == 'multipart/form-data':
+        request.form_data_parser_class = InMemoryFormDataParser
+        try:
+            upload = request.files.get('image')
+        except RequestEntityTooLarge:
+            return jsonify(too_large), 413
+        if upload is None:
+            return jsonify({'error': "Multipart uploads must include an 'image' file"}), 400
+        data = upload.read(MAX_UPLOAD_BYTES + 1)
     else:
-        ratios = [0.25] * 4  # equal share if no vehicles
-
-    # Build per-lane timings
-    timings = {}
-    cycle_length = 0
-    for lane_idx, ratio in enumerate(ratios):
-        g = int(green_budget * ratio)
-        # enforce per-lane clamps
-        g = max(min_green, min(g, max_green))
-        y = base_yellow
-        # red is cycle minus (green + yellow)
-        # here assume cycle is green_budget + yellow + base_red
-        # so each lane’s red = (green_budget + base_red) - (g + y)
-        lane_cycle = green_budget + base_red
-        r = lane_cycle - (g + y)
-        timings[str(lane_idx)] = {'green': g, 'yellow': y, 'red': r}
-        cycle_length = max(cycle_length, lane_cycle)
-
-    timings['cycle_length'] = cycle_length
-    timings['vehicle_count']=total_vehicles
-    return timings
+        # Read at most one byte past the limit in case no Content-Length was sent
+        data = request.stream.read(MAX_UPLOAD_BYTES + 1)
+
+    if len(data) > MAX_UPLOAD_BYTES:
+        return jsonify(too_large), 413
+    if not data:
+        return jsonify({'error': 'No image data provided'}), 400
+
+    return _analyze(data, max_pixels=MAX_UPLOAD_PIXELS,
+                    camera=request.args.get('camera'), timestamp=request.args.get('timestamp'))
+
+@app.route('/api/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """Analyze many traffic images in one request (no visualizations)"""
+    data = request.json
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    image_paths = data.get('image_paths')
+
+    if not image_paths or not isinstance(image_paths, list):
+        return jsonify({'error': 'image_paths must be a non-empty list'}), 400
+
+    if len(image_paths) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} images per batch'}), 400
+
+    try:
+        geometry = get_geometry(data.get('camera') or request.headers.get('X-Camera-Id'))
+        batch = predict_traffic_batch(image_paths, geometry=geometry)
+    except Exception as e:
+        return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
+
+    items = []
+    for prediction, counts, img_path in batch:
+        if counts is None:
+            items.append({'image_path': img_path, 'error': f'Failed to analyze image: {img_path}'})
+            continue
+        items.append({
+            'image_path': img_path,
+            'prediction': prediction,
+            'counts': counts,
+            'timings': calculate_traffic_light_timings_per_lane(counts, prediction)
+        })
+
+    return jsonify({'results': items})
+
+@app.route('/api/timings/bulk', methods=['POST'])
+def bulk_timings():
+    """Calculate traffic light timings for many intersections in one call"""
+    data = request.json
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    counts = data.get('counts')
+    predictions = data.get('predictions')
+
+    if not counts or predictions is None:
+        return jsonify({'error': 'counts and predictions are required'}), 400
+
+    if not isinstance(counts, list) or not isinstance(predictions, list):
+        return jsonify({'error': 'counts and predictions must be lists'}), 400
+
+    if len(counts) > MAX_BULK_INTERSECTIONS:
+        return jsonify({'error': f'At most {MAX_BULK_INTERSECTIONS} intersections per request'}), 400
+
+    try:
+        timings = calculate_traffic_light_timings_bulk(counts, predictions)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Invalid input: {str(e)}'}), 400
+
+    return jsonify({key: value.tolist() for key, value in timings.items()})
+
+def _history_window():
+    """Read camera and [start, end) from the query string (default: the last 24 hours)"""
+    camera = request.args.get('camera', DEFAULT_CAMERA)
+    end = request.args.get('end', type=float)
+    end = time.time() if end is None else end
+    start = request.args.get('start', type=float)
+    start = end - 86400 if start is None else start
+    if start >= end:
+        raise ValueError('start must be before end')
+    return camera, start, end
+
+@app.route('/api/history/cameras')
+def history_cameras():
+    """List cameras with recorded analysis history"""
+    return jsonify({'cameras': history.cameras()})
+
+@app.route('/api/history/aggregate')
+def history_aggregate():
+    """Per-lane count statistics (mean, percentiles, peak) over a time window"""
+    try:
+        camera, start, end = _history_window()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'camera': camera, 'start': start, 'end': end,
+                    'lanes': history.aggregate(camera, start, end)})
+
+@app.route('/api/history/series')
+def history_series():
+    """Per-lane mean and peak counts per hour or day over a time window"""
+    try:
+        camera, start, end = _history_window()
+        series = history.series(camera, start, end, request.args.get('interval', 'hour'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'camera': camera, 'start': start, 'end': end, 'series': series})
+
+@app.route('/api/visualization/<viz_id>')
+def get_visualization(viz_id):
+    """Serve a rendered visualization, or report that it is still pending"""
+    status, result = visualizations.result(viz_id)
+
+    if status == 'missing':
+        return jsonify({'error': f'Unknown visualization: {viz_id}'}), 404
+    if status == 'pending':
+        return jsonify({'status': 'pending'}), 202
+    if status == 'failed':
+        return jsonify({'error': f'Visualization failed: {result}'}), 500
+
+    response = Response(result, mimetype='image/png')
+    # IDs are derived from the image content and analysis, so they never change
+    response.headers['Cache-Control'] = 'private, max-age=3600, immutable'
+    return response
+
+@app.route('/data/<filename>')
+def serve_image(filename):
+    """Serve traffic images from the data directory"""
+    # ETag/Last-Modified let repeat views revalidate with a 304
+    return send_from_directory('data', filename, max_age=IMAGE_MAX_AGE)
+
+@app.route('/thumbnails/<filename>')
+def serve_thumbnail(filename):
+    """Serve a small JPEG thumbnail of a traffic image, creating it on first use"""
+    try:
+        path = thumbnails.get(filename)
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': f'Thumbnail failed: {str(e)}'}), 500
+
+    return send_file(os.path.abspath(path), mimetype='image/jpeg', max_age=IMAGE_MAX_AGE)
 
 if __name__ == '__main__':
     # Make sure required directories exist
@@ -151,4 +417,7 @@ if __name__ == '__main__':
         if not os.path.exists(directory):
             os.makedirs(directory)
 
+    # Pre-generate thumbnails for the first grid pages
+    thumbnails.warm_up_async(image_index.names()[:WARM_UP_IMAGES])
+
     app.run(debug=True, port=5000)
@@ -0,0 +1,135 @@
+import numpy as np
+
+# Base cycle parameters
+BASE_GREEN = 30     # nominal total green-time budget (sec) to split among lanes
+BASE_YELLOW = 5     # fixed per-lane yellow
+BASE_RED = 30       # nominal red (will be adjusted per lane)
+MIN_GREEN = 10      # per-lane minimum green
+MAX_GREEN = 60      # per-lane maximum green
+
+# Green budget multiplier per congestion level (anything else counts as low)
+CONGESTION_MULTIPLIERS = {
+    "High Congestion": 1.5,
+    "Medium Congestion": 1.2,
+}
+
+def congestion_multiplier(prediction):
+    """Returns the green budget multiplier for a congestion prediction."""
+    return CONGESTION_MULTIPLIERS.get(prediction, 1.0)
+
+def calculate_traffic_light_timings_per_lane(counts, prediction):
+    """
+    Calculate dynamic traffic light timings for each lane of an intersection.
+
+    Args:
+        counts (list of int): vehicle counts per lane, e.g. [c1, c2, c3, c4].
+        prediction (str): one of "High Congestion", "Medium Congestion", or "Low Congestion".
+
+    Returns:
+        dict: {
+            0: {'green': G1, 'yellow': Y, 'red': R1},
+            1: {'green': G2, 'yellow': Y, 'red': R2},
+            ...
+            'cycle_length': C
+        }
+    """
+    # Any lane layout works, but there has to be at least one lane
+    if not counts:
+        raise ValueError("counts must be a non-empty list of non-negative integers")
+
+    total_vehicles = sum(counts)
+    # Base cycle parameters
+    base_green = BASE_GREEN
+    base_yellow = BASE_YELLOW
+    base_red = BASE_RED
+    min_green = MIN_GREEN
+    max_green = MAX_GREEN
+
+    # Congestion multiplier
+    cong_mul = congestion_multiplier(prediction)
+
+    # Adjust the total green budget by congestion
+    green_budget = int(base_green * cong_mul)
+    # Distribute green_budget proportionally, or equally if no vehicles
+    if int(total_vehicles) > 0:
+        ratios = [c / total_vehicles for c in counts]
+    else:
+        ratios = [1 / len(counts)] * len(counts)  # equal share if no vehicles
+
+    # Build per-lane timings
+    timings = {}
+    cycle_length = 0
+    for lane_idx, ratio in enumerate(ratios):
+        g = int(green_budget * ratio)
+        # enforce per-lane clamps
+        g = max(min_green, min(g, max_green))
+        y = base_yellow
+        # red is cycle minus (green + yellow)
+        # here assume cycle is green_budget + yellow + base_red
+        # so each lane’s red = (green_budget + base_red) - (g + y)
+        lane_cycle = green_budget + base_red
+        r = lane_cycle - (g + y)
+        timings[str(lane_idx)] = {'green': g, 'yellow': y, 'red': r}
+        cycle_length = max(cycle_length, lane_cycle)
+
+    timings['cycle_length'] = cycle_length
+    timings['vehicle_count']=total_vehicles
+    return timings
+
+def calculate_traffic_light_timings_bulk(counts, predictions):
+    """
+    Vectorized calculate_traffic_light_timings_per_lane for many intersections.
+
+    Produces the same per-lane values as the scalar version for any lane count.
+
+    Args:
+        counts: (N, L) array of non-negative vehicle counts per lane
+        predictions: N congestion predictions (strings as accepted by the
+            scalar version)
+
+    Returns:
+        dict with 'green', 'yellow', 'red' (N, L) int arrays and
+        'cycle_length', 'vehicle_count' (N,) int arrays
+    """
+    counts = np.asarray(counts)
+    if counts.ndim != 2 or counts.shape[1] == 0:
+        raise ValueError("counts must be an (N, lanes) array")
+    if np.any(counts < 0):
+        raise ValueError("counts must be non-negative")
+
+    # Checked before conversion, which would turn numbers in a mixed list into strings
+    if not (isinstance(predictions, np.ndarray) and predictions.dtype.kind == 'U'):
+        if not all(isinstance(p, str) for p in predictions):
+            raise ValueError("predictions must be congestion level strings")
+    predictions = np.asarray(predictions)
+    if predictions.shape != (counts.shape[0],):
+        raise ValueError("predictions must have one entry per intersection")
+
+    num_lanes = counts.shape[1]
+    total_vehicles = counts.sum(axis=1)
+
+    # Congestion multiplier
+    cong_mul = np.ones(len(predictions))
+    for level, multiplier in CONGESTION_MULTIPLIERS.items():
+        cong_mul[predictions == level] = multiplier
+
+    # Adjust the total green budget by congestion
+    green_budget = (BASE_GREEN * cong_mul).astype(np.int64)
+
+    # Distribute green_budget proportionally, or equally if no vehicles
+    ratios = np.where(total_vehicles[:, None] > 0,
+                      counts / np.maximum(total_vehicles, 1)[:, None],
+                      1.0 / num_lanes)
+
+    green = np.clip(np.floor(green_budget[:, None] * ratios).astype(np.int64), MIN_GREEN, MAX_GREEN)
+    yellow = np.full_like(green, BASE_YELLOW)
+    cycle_length = green_budget + BASE_RED
+    red = cycle_length[:, None] - (green + yellow)
+
+    return {
+        'green': green,
+        'yellow': yellow,
+        'red': red,
+        'cycle_length': cycle_length,
+        'vehicle_count': total_vehicles,
+    }
@@ -3,27 +3,43 @@ document.addEventListener("DOMContentLoaded", function () {
   fetchImages();
 });
 
-async function fetchImages() {
+// Images fetched per page from /api/images
+const IMAGE_PAGE_SIZE = 100;
+
+async function fetchImages(cursor = null) {
+  const grid = document.getElementById("image-grid");
   try {
-    const response = await fetch("/api/images");
+    const params = new URLSearchParams({ limit: IMAGE_PAGE_SIZE });
+    if (cursor) {
+      params.set("cursor", cursor);
+    }
+    const response = await fetch(`/api/images?${params}`);
     const data = await response.json();
 
+    if (!cursor) {
+      grid.innerHTML = "";
+    }
+
     if (data.images && data.images.length > 0) {
-      displayImages(data.images);
-    } else {
-      document.getElementById("image-grid").innerHTML =
+      displayImages(data.images, data.next_cursor);
+    } else if (!cursor) {
+      grid.innerHTML =
         "<p class='select-prompt'>No traffic images available</p>";
     }
   } catch (error) {
     console.error("Error fetching images:", error);
-    document.getElementById("image-grid").innerHTML =
-      "<p class='select-prompt'>Error loading images. Please try again.</p>";
+    if (!cursor) {
+      grid.innerHTML =
+        "<p class='select-prompt'>Error loading images. Please try again.</p>";
+    }
   }
 }
 
-function displayImages(images) {
+function displayImages(images, nextCursor) {
   const grid = document.getElementById("image-grid");
-  grid.innerHTML = "";
+
+  // Drop the previous page's "Load more" button
+  grid.querySelector(".load-more-button")?.remove();
 
   images.forEach((imageName) => {
     const imagePath = `data/${imageName}`;
@@ -36,13 +52,24 @@ function displayImages(images) {
     );
 
     const img = document.createElement("img");
-    img.src = `/data/${imageName}`;
+    img.src = `/thumbnails/${imageName}`;
     img.alt = `Traffic Image: ${imageName}`;
     img.loading = "lazy"; // Lazy load images for better performance
 
     imageItem.appendChild(img);
     grid.appendChild(imageItem);
   });
+
+  if (nextCursor) {
+    const loadMore = document.createElement("button");
+    loadMore.className = "load-more-button";
+    loadMore.textContent = "Load more";
+    loadMore.addEventListener("click", () => {
+      loadMore.disabled = true;
+      fetchImages(nextCursor);
+    });
+    grid.appendChild(loadMore);
+  }
 }
 
 async function selectImage(imagePath, event) {
@@ -241,13 +268,35 @@ function displayAnalysisResults(data) {
 
   resultsContainer.innerHTML = html;
 
-  // Display visualization
-  if (data.visualization) {
-    const visualizationContainer = document.getElementById("visualization");
+  // Visualization is rendered in the background; fetch it when ready
+  if (data.visualization_url) {
+    loadVisualization(data.visualization_url);
+  }
+}
+
+async function loadVisualization(url, attempt = 0) {
+  const visualizationContainer = document.getElementById("visualization");
+  try {
+    const response = await fetch(url);
+
+    if (response.status === 202 && attempt < 50) {
+      // Still rendering, poll again shortly
+      setTimeout(() => loadVisualization(url, attempt + 1), 200);
+      return;
+    }
+
+    if (!response.ok) {
+      throw new Error(`Visualization unavailable (${response.status})`);
+    }
+
+    const blob = await response.blob();
     visualizationContainer.innerHTML = `
-      <img src="data:image/png;base64,${data.visualization}"
+      <img src="${URL.createObjectURL(blob)}"
            alt="Traffic Analysis Visualization">
     `;
+  } catch (error) {
+    console.error("Error loading visualization:", error);
+    visualizationContainer.innerHTML = "";
   }
 }
 
@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+from functools import partial
+import cv2
+from detector import count_vehicles, FrameDiffDetector
+from lane_geometry import get_geometry
+from signal_timing import calculate_traffic_light_timings_per_lane
+from traffic_predictor import load_lookup_table, load_model, predict_counts
+
+# Marks the end of the stream on every queue
+_END = object()
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+def _read_frames(source, stride):
+    """
+    Yields (frame_index, timestamp_ms, name, frame) for every stride-th frame.
+
+    source may be a video file, a cv2.VideoCapture URL/pattern or a directory
+    of images (processed in name order). Skipped video frames are grabbed but
+    not decoded.
+    """
+    if os.path.isdir(source):
+        names = sorted(f for f in os.listdir(source) if f.lower().endswith(IMAGE_EXTENSIONS))
+        for index in range(0, len(names), stride):
+            frame = cv2.imread(os.path.join(source, names[index]))
+            if frame is None:
+                print(f"Warning: Failed to read image: {names[index]}", file=sys.stderr)
+                continue
+            yield index, None, names[index], frame
+        return
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Could not open video source: {source}")
+    try:
+        index = 0
+        while True:
+            if index % stride:
+                if not cap.grab():
+                    break
+                index += 1
+                continue
+            ok, frame = cap.read()
+            if not ok:
+                break
+            yield index, cap.get(cv2.CAP_PROP_POS_MSEC), None, frame
+            index += 1
+    finally:
+        cap.release()
+
+class _Stage(threading.Thread):
+    """Pipeline thread that records the first error it hits."""
+
+    def __init__(self, target, name):
+        super().__init__(name=name, daemon=True)
+        self._target_fn = target
+        self.error = None
+
+    def run(self):
+        try:
+            self._target_fn()
+        except BaseException as e:
+            self.error = e
+
+def _put(q, item, stop):
+    """Blocking put that gives up once the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q, stop):
+    """Blocking get that returns _END once the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+def process_stream(source, output=sys.stdout, stride=1, queue_size=16, batch_size=32,
+                   frame_diff=False, camera=None):
+    """
+    Runs decode -> lane counting -> prediction -> signal timing over a frame stream.
+
+    Each stage runs in its own thread connected by bounded queues, so a slow
+    stage applies backpressure to the ones before it instead of buffering
+    frames without limit. The prediction stage drains whatever is waiting
+    (up to batch_size) and classifies it with one predict_counts call.
+    One JSON object per processed frame is written to output.
+
+    Args:
+        source: Video file, capture URL or image directory
+        output: Text stream that receives JSON lines
+        stride: Process every stride-th frame
+        queue_size: Capacity of each inter-stage queue
+        batch_size: Maximum frames per prediction call
+        frame_diff: Use a FrameDiffDetector so lanes that did not change since
+            the previous frame reuse their counts instead of being re-detected
+        camera: Camera ID whose lane geometry (data/lane_geometry.json) is used
+
+    Returns:
+        Number of frames processed
+    """
+    if stride < 1:
+        raise ValueError("stride must be at least 1")
+
+    # Fail before starting the pipeline if there is nothing to predict with
+    if load_lookup_table('data') is None:
+        load_model('data')
+
+    frames = queue.Queue(maxsize=queue_size)
+    counted = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    processed = 0
+    geometry = get_geometry(camera)
+    if frame_diff:
+        counter = FrameDiffDetector(geometry=geometry).update
+    else:
+        counter = partial(count_vehicles, geometry=geometry)
+
+    def decode():
+        try:
+            for item in _read_frames(source, stride):
+                if not _put(frames, item, stop):
+                    return
+        finally:
+            _put(frames, _END, stop)
+
+    def detect():
+        try:
+            while True:
+                item = _get(frames, stop)
+                if item is _END:
+                    return
+                index, timestamp, name, frame = item
+                if not _put(counted, (index, timestamp, name, counter(frame)), stop):
+                    return
+        finally:
+            _put(counted, _END, stop)
+
+    stages = [_Stage(decode, 'decode'), _Stage(detect, 'detect')]
+    for stage in stages:
+        stage.start()
+
+    try:
+        done = False
+        while not done:
+            batch = [_get(counted, stop)]
+            while len(batch) < batch_size:
+                try:
+                    batch.append(counted.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is _END:
+                batch.pop()
+                done = True
+            if not batch:
+                continue
+
+            predictions = predict_counts([item[3] for item in batch])
+            for (index, timestamp, name, counts), prediction in zip(batch, predictions):
+                result = {
+                    'frame': index,
+                    'timestamp_ms': timestamp,
+                    'prediction': str(prediction),
+                    'counts': counts,
+                    'timings': calculate_traffic_light_timings_per_lane(counts, prediction)
+                }
+                if name is not None:
+                    result['image'] = name
+                output.write(json.dumps(result) + '\n')
+                processed += 1
+            output.flush()
+    finally:
+        stop.set()
+        for stage in stages:
+            stage.join()
+
+    for stage in stages:
+        if stage.error is not None:
+            raise stage.error
+    return processed
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze a traffic video or image sequence')
+    parser.add_argument('source', help='Video file, capture URL or directory of frames')
+    parser.add_argument('--stride', type=int, default=1, help='Process every Nth frame')
+    parser.add_argument('--queue-size', type=int, default=16, help='Capacity of each pipeline queue')
+    parser.add_argument('--batch-size', type=int, default=32, help='Maximum frames per prediction call')
+    parser.add_argument('--frame-diff', action='store_true',
+                        help='Only re-detect lanes that changed since the previous frame')
+    parser.add_argument('--camera', type=str, default=None,
+                        help='Camera ID whose lane geometry to use (default: the default camera)')
+    parser.add_argument('--output', type=str, default=None, help='JSON-lines output file (default: stdout)')
+    args = parser.parse_args()
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        count = process_stream(args.source, output, stride=args.stride,
+                               queue_size=args.queue_size, batch_size=args.batch_size,
+                               frame_diff=args.frame_diff, camera=args.camera)
+        print(f"Processed {count} frames", file=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,211 @@
+import argparse
+import os
+import threading
+from collections import OrderedDict
+import cv2
+import metrics
+from model_registry import write_atomic
+
+# Thumbnail width in pixels; height follows the frame's aspect ratio
+THUMBNAIL_WIDTH = 160
+JPEG_QUALITY = 80
+
+# Upper bound on the on-disk cache; least recently used thumbnails are evicted first
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+# Share of max_bytes a process may write before re-reading the directory's real
+# size, which other processes (serve.py workers) add to as well
+RESCAN_FRACTION = 16
+
+class ThumbnailCache:
+    """
+    Small pre-encoded JPEG thumbnails of the frames in source_dir, stored in a
+    size-bounded directory.
+
+    Cache files are named after the source file and its mtime, so a frame that
+    is overwritten gets a new thumbnail and the old one ages out. Usage order is
+    tracked in memory (seeded from file mtimes) and the least recently used
+    thumbnails are deleted once the cache exceeds max_bytes.
+
+    Several processes may share the directory, so the size accounting is
+    rebuilt from the directory before evicting and after every
+    max_bytes / RESCAN_FRACTION bytes this process writes. The cache can
+    then only overshoot by that much per process.
+    """
+
+    def __init__(self, source_dir='data', cache_dir=os.path.join('output', 'thumbnails'),
+                 width=THUMBNAIL_WIDTH, max_bytes=MAX_CACHE_BYTES, quality=JPEG_QUALITY):
+        self.source_dir = source_dir
+        self.cache_dir = cache_dir
+        self.width = width
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # cache file name -> size, oldest first
+        self._total = 0
+        self._used = OrderedDict()      # names used by this process since the last rescan
+        self._written = 0               # bytes written by this process since the last rescan
+        with self._lock:
+            self._rescan()
+            self._evict()
+
+    def _rescan(self):
+        """
+        Rebuilds the size accounting from the files in the cache directory (lock held).
+
+        Files are ordered by mtime, except that the ones this process used since
+        the last rescan are moved to the end in the order it used them.
+        """
+        found = []
+        if os.path.isdir(self.cache_dir):
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.jpg'):
+                        continue
+                    try:
+                        if entry.is_file():
+                            st = entry.stat()
+                            found.append((st.st_mtime_ns, entry.name, st.st_size))
+                    except FileNotFoundError:
+                        continue
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(found))
+        for name in self._used:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+        self._total = sum(self._entries.values())
+        self._used.clear()
+        self._written = 0
+
+    def _evict(self):
+        """Deletes least recently used thumbnails until the cache fits (lock held)."""
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def _touch(self, name):
+        """Marks a cached thumbnail as most recently used (lock held)."""
+        self._entries.move_to_end(name)
+        self._used[name] = None
+        self._used.move_to_end(name)
+
+    def source_path(self, filename):
+        """
+        Returns the path of a frame in source_dir.
+
+        Raises:
+            FileNotFoundError: If filename is not a plain file name in source_dir
+        """
+        path = os.path.join(self.source_dir, filename)
+        if os.path.basename(filename) != filename or not os.path.isfile(path):
+            raise FileNotFoundError(f"Image not found: {filename}")
+        return path
+
+    def _cache_name(self, filename, mtime_ns):
+        # The full name keeps x.png and x.jpg apart
+        return f"{filename}-{self.width}-{mtime_ns:x}.jpg"
+
+    def _render(self, source):
+        """Decodes a frame and encodes a JPEG thumbnail of it."""
+        with metrics.stage('thumbnail'):
+            img = cv2.imread(source)
+            if img is None:
+                raise Exception(f"Failed to read image: {source}")
+            height = max(1, round(img.shape[0] * self.width / img.shape[1]))
+            thumb = cv2.resize(img, (self.width, height), interpolation=cv2.INTER_AREA)
+            ok, encoded = cv2.imencode('.jpg', thumb, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise Exception(f"Failed to encode thumbnail for {source}")
+        return encoded.tobytes()
+
+    def get(self, filename):
+        """
+        Returns the path of the thumbnail for filename, generating it if needed.
+
+        Args:
+            filename: Name of a frame in source_dir
+
+        Returns:
+            Path to the JPEG thumbnail
+
+        Raises:
+            FileNotFoundError: If the frame does not exist
+        """
+        source = self.source_path(filename)
+        name = self._cache_name(filename, os.stat(source).st_mtime_ns)
+        path = os.path.join(self.cache_dir, name)
+
+        with self._lock:
+            # Another process may have created or evicted the file
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                size = None
+            if size is None:
+                if name in self._entries:
+                    self._total -= self._entries.pop(name)
+            else:
+                if name not in self._entries:
+                    self._entries[name] = size
+                    self._total += size
+                self._touch(name)
+                metrics.increment('thumbnail_cache', result='hit')
+                return path
+
+        metrics.increment('thumbnail_cache', result='miss')
+        data = self._render(source)
+        write_atomic(path, data)
+
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = len(data)
+                self._total += len(data)
+            self._touch(name)
+            self._written += len(data)
+            if self._total > self.max_bytes or self._written > self.max_bytes // RESCAN_FRACTION:
+                self._rescan()
+            self._evict()
+        return path
+
+    def warm_up(self, filenames):
+        """
+        Generates thumbnails for every frame that doesn't have one yet.
+
+        Args:
+            filenames: Frame names in source_dir
+
+        Returns:
+            Number of thumbnails that could be produced
+        """
+        done = 0
+        for filename in filenames:
+            try:
+                self.get(filename)
+                done += 1
+            except Exception as e:
+                print(f"Warning: Could not create thumbnail for {filename}: {e}")
+        return done
+
+    def warm_up_async(self, filenames):
+        """Runs warm_up() on a daemon thread and returns the thread."""
+        thread = threading.Thread(target=self.warm_up, args=(list(filenames),),
+                                  name='thumbnail-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+if __name__ == '__main__':
+    from image_index import ImageIndex
+
+    parser = argparse.ArgumentParser(description='Pre-generate thumbnails for the images in data/')
+    parser.add_argument('--width', type=int, default=THUMBNAIL_WIDTH, help='Thumbnail width in pixels')
+    args = parser.parse_args()
+
+    try:
+        cache = ThumbnailCache(width=args.width)
+        count = cache.warm_up(ImageIndex('data').names())
+        print(f"Created or verified {count} thumbnails in '{cache.cache_dir}'")
+    except Exception as e:
+        print(f"Error: {e}")
@@ -1,55 +1,132 @@
 import cv2
+import hashlib
+import io
+import json
 import numpy as np
 import os
-import pickle
+import metrics
+from concurrent.futures import ThreadPoolExecutor
+from detector import count_vehicles, MIN_AREA
+from lane_geometry import get_geometry
+from model_registry import get_model, get_registry
 
-def predict_traffic(image_path=None):
+def load_model(data_dir='data'):
     """
-    Predicts traffic density from an image using the trained model.
+    Returns the trained model from the in-memory registry.
 
     Args:
-        image_path: Path to the image to analyze. If None, uses the last image in the data directory.
+        data_dir: Directory containing traffic_model.pkl
 
     Returns:
-        Prediction result and lane counts
+        The trained classifier
     """
-    data_dir = 'data'
     model_path = os.path.join(data_dir, 'traffic_model.pkl')
 
     # Check if model exists
     if not os.path.exists(model_path):
         raise FileNotFoundError(f"Model file not found: {model_path}. Please run model training first.")
 
-    # Load the model
+    # Load the model (cached in memory, reloaded when the file changes)
     try:
-        with open(model_path, 'rb') as f:
-            model = pickle.load(f)
+        return get_model(model_path)
     except Exception as e:
         raise Exception(f"Error loading model: {e}")
 
-    # Ensure data directory exists
-    if not os.path.exists(data_dir):
-        raise FileNotFoundError(f"Data directory not found: {data_dir}")
+def _lookup_table_loader(meta_path):
+    """Returns a registry loader that pairs a .npy table with its label sidecar."""
+    def load(data):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('sha256') != hashlib.sha256(data).hexdigest():
+            raise Exception(f"Lookup table does not match {meta_path}")
+        table = np.load(io.BytesIO(data), allow_pickle=False)
+        return table, np.array(meta['labels'])
+    return load
 
-    # If no image specified, use the last image in data directory
-    if image_path is None:
-        # Find image files in data directory (support multiple formats)
-        image_files = [f for f in os.listdir(data_dir)
-                     if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        if not image_files:
-            raise FileNotFoundError("No images found in data directory. Please add images or generate synthetic data first.")
+def load_lookup_table(data_dir='data'):
+    """
+    Returns the compiled lookup table written by model training.
 
-        # Sort by name and get the last one
-        image_files.sort()
-        image_path = os.path.join(data_dir, image_files[-1])
+    Args:
+        data_dir: Directory containing traffic_model_lut.npy and .json
+
+    Returns:
+        (table, labels), or None if no usable table exists
+    """
+    lut_path = os.path.join(data_dir, 'traffic_model_lut.npy')
+    meta_path = os.path.join(data_dir, 'traffic_model_lut.json')
+    if not os.path.exists(lut_path) or not os.path.exists(meta_path):
+        return None
+
+    try:
+        return get_registry().get(lut_path, loader=_lookup_table_loader(meta_path))
+    except Exception as e:
+        print(f"Warning: Could not load lookup table, using the model: {e}")
+        return None
 
+def model_version(data_dir='data'):
+    """
+    Returns a string identifying the model and detector settings predictions
+    currently come from. It changes whenever retraining replaces the model.
+    Lane geometry is per camera and not part of it.
+
+    Args:
+        data_dir: Directory containing the model files
+    """
+    if load_lookup_table(data_dir) is not None:
+        path = os.path.join(data_dir, 'traffic_model_lut.npy')
+    else:
+        load_model(data_dir)
+        path = os.path.join(data_dir, 'traffic_model.pkl')
+    return f"{get_registry().version(path)}:{MIN_AREA}"
+
+def predict_counts(counts, data_dir='data'):
+    """
+    Classifies per-lane count vectors.
+
+    Counts covered by the compiled lookup table are answered with a single
+    array index; anything outside its range (or with a different number of
+    lanes) falls back to the pickled model, which is only loaded if needed.
+
+    Args:
+        counts: (N, lanes) matrix of vehicle counts
+        data_dir: Directory containing the model files
+
+    Returns:
+        Array of N predicted labels
+
+    Raises:
+        ValueError: If the model was trained on a different number of lanes
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    lut = load_lookup_table(data_dir)
+    if lut is None or counts.ndim != 2 or counts.shape[1] != lut[0].ndim:
+        model = load_model(data_dir)
+        expected = getattr(model, 'n_features_in_', None)
+        if counts.ndim == 2 and expected is not None and counts.shape[1] != expected:
+            raise ValueError(f"Model was trained on {expected} lanes, got counts for {counts.shape[1]}")
+        return model.predict(counts)
+
+    table, labels = lut
+    in_range = np.all((counts >= 0) & (counts < np.array(table.shape)), axis=1)
+    if in_range.all():
+        return labels[table[tuple(counts.T)]]
+
+    predictions = np.empty(len(counts), dtype=labels.dtype)
+    predictions[in_range] = labels[table[tuple(counts[in_range].T)]]
+    predictions[~in_range] = load_model(data_dir).predict(counts[~in_range])
+    return predictions
+
+def read_image(image_path):
+    """Reads and validates an image, raising on failure."""
     # Check if image exists
     if not os.path.exists(image_path):
         raise FileNotFoundError(f"Image not found: {image_path}")
 
     # Process the image to extract features
     try:
-        img = cv2.imread(image_path)
+        with metrics.stage('imread'):
+            img = cv2.imread(image_path)
         if img is None:
             raise Exception(f"Failed to read image: {image_path}")
 
@@ -59,50 +136,138 @@ def predict_traffic(image_path=None):
     except Exception as e:
         raise Exception(f"Error processing image: {e}")
 
-    # Extract lane counts (similar to feature_extractor)
-    num_lanes = 4
-    lane_width = 200
+    return img
+
+def decode_image(data):
+    """
+    Decodes an encoded image (PNG, JPEG, ...) from an in-memory buffer.
+
+    Args:
+        data: Encoded image bytes
+
+    Returns:
+        BGR image as a NumPy array
+
+    Raises:
+        ValueError: If the bytes are not a decodable image
+    """
+    if not data:
+        raise ValueError("Empty image data")
+
+    with metrics.stage('imdecode'):
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image data")
+
+    # Validate image dimensions
+    if img.shape[0] == 0 or img.shape[1] == 0:
+        raise ValueError(f"Invalid image dimensions: {img.shape}")
+    return img
 
+def _count_image(image_path, geometry=None):
+    """Reads an image and returns its per-lane vehicle counts."""
+    img = read_image(image_path)
+
+    # Extract lane counts (shared with feature_extractor)
     try:
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-        # Apply thresholding to create binary image
-        _, thresh = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
-
-        # Find contours representing vehicles
-        contours, _ = cv2.findContours(
-            thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-        )
-
-        # Count vehicles per lane
-        counts = [0] * num_lanes
-        for cnt in contours:
-            # Calculate moments to find centroid
-            M = cv2.moments(cnt)
-            if M["m00"] == 0:
-                continue
-
-            # Get contour area and filter out very small contours (noise)
-            area = cv2.contourArea(cnt)
-            if area < 100:  # Minimum area threshold
-                continue
-
-            # Calculate centroid position
-            cx = int(M["m10"] / M["m00"])
-
-            # Determine which lane the vehicle is in
-            lane = min(cx // lane_width, num_lanes - 1)
-            counts[lane] += 1
+        return count_vehicles(img, geometry=geometry or get_geometry())
     except Exception as e:
         raise Exception(f"Error in vehicle detection: {e}")
 
+def predict_image(img, geometry=None):
+    """
+    Predicts traffic density for an already decoded image.
+
+    Args:
+        img: BGR image as a NumPy array
+        geometry: LaneGeometry of the camera (defaults to the default camera's)
+
+    Returns:
+        (prediction, counts)
+    """
+    try:
+        counts = count_vehicles(img, geometry=geometry or get_geometry())
+    except Exception as e:
+        raise Exception(f"Error in vehicle detection: {e}")
+
+    with metrics.stage('model_predict'):
+        prediction = predict_counts([counts])[0]
+    return prediction, counts
+
+def predict_traffic(image_path=None):
+    """
+    Predicts traffic density from an image using the trained model.
+
+    Args:
+        image_path: Path to the image to analyze. If None, uses the last image in the data directory.
+
+    Returns:
+        Prediction result and lane counts
+    """
+    data_dir = 'data'
+
+    # Ensure data directory exists
+    if not os.path.exists(data_dir):
+        raise FileNotFoundError(f"Data directory not found: {data_dir}")
+
+    # If no image specified, use the last image in data directory
+    if image_path is None:
+        # Find image files in data directory (support multiple formats)
+        image_files = [f for f in os.listdir(data_dir)
+                     if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+        if not image_files:
+            raise FileNotFoundError("No images found in data directory. Please add images or generate synthetic data first.")
+
+        # Sort by name and get the last one
+        image_files.sort()
+        image_path = os.path.join(data_dir, image_files[-1])
+
+    img = read_image(image_path)
+    prediction, counts = predict_image(img)
     print(counts)
-    # Make prediction
-    prediction = model.predict([counts])[0]
 
     return prediction, counts, image_path
 
+def predict_traffic_batch(image_paths, max_workers=None, geometry=None):
+    """
+    Predicts traffic density for many images at once.
+
+    Images are decoded and counted concurrently on a thread pool (OpenCV
+    releases the GIL), then classified with a single predict_counts call over
+    the stacked count matrix.
+
+    Args:
+        image_paths: Iterable of image paths to analyze
+        max_workers: Size of the decoding thread pool (defaults to the executor's default)
+        geometry: LaneGeometry of the camera (defaults to the default camera's)
+
+    Returns:
+        List of (prediction, counts, image_path) tuples in input order. Images that
+        could not be read or analyzed are returned as (None, None, image_path).
+    """
+    image_paths = list(image_paths)
+
+    def safe_count(path):
+        try:
+            return _count_image(path, geometry)
+        except Exception as e:
+            print(f"Warning: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        all_counts = list(executor.map(safe_count, image_paths))
+
+    ok = [i for i, counts in enumerate(all_counts) if counts is not None]
+    predictions = [None] * len(image_paths)
+    if ok:
+        matrix = np.array([all_counts[i] for i in ok], dtype=np.int64)
+        with metrics.stage('model_predict_batch'):
+            batch_predictions = predict_counts(matrix)
+        for i, prediction in zip(ok, batch_predictions):
+            predictions[i] = prediction
+
+    return list(zip(predictions, all_counts, image_paths))
+
 if __name__ == "__main__":
     try:
         prediction, counts, image_path = predict_traffic()
@@ -2,6 +2,7 @@ import cv2
 import numpy as np
 import os
 import matplotlib.pyplot as plt
+from feature_extractor import load_features
 
 def visualize_traffic(image_path, lane_counts, prediction):
     """
@@ -110,9 +111,7 @@ def visualize_dataset_summary():
 
     try:
         # Load features and labels
-        data = np.load(features_path, allow_pickle=True)
-        X = data['X']
-        y = data['y']
+        X, y = load_features(features_path)
 
         # Count samples per class
         classes, counts = np.unique(y, return_counts=True)
@@ -169,7 +168,7 @@ def visualize_dataset_summary():
         
         # Add overall stats as text
         total_samples = len(X)
-        avg_total_vehicles = np.mean([sum(x) for x in X])
+        avg_total_vehicles = X.sum(axis=1).mean()
         ax1.text(0.5, -0.2, 
                 f'Dataset Summary: {total_samples} samples with {avg_total_vehicles:.1f} vehicles per image on average',
                 ha='center', transform=ax1.transAxes, fontsize=11, fontweight='bold',